@@ -0,0 +1,198 @@
+"""
+Local cache of the rescuetime files we uploaded to Open Humans.
+
+Files are stored as <RESCUETIME_CACHE_DIR>/<oh_id>/<key>.json, where the
+key is the sha256 digest we put into the file's metadata on upload (or the
+OH file id for files uploaded before). Next to each file its day index
+(see datauploader/streaming.py) is stored as <key>.json.index. Only the
+latest file of a member is kept and the whole cache is bounded to
+RESCUETIME_CACHE_MAX_BYTES by evicting the least recently used files.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+from django.conf import settings
+from demotemplate.http_client import get_session
+from datauploader.streaming import build_index
+from datauploader.formats import decode
+from datauploader import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return stream_digest(f)
+
+
+def stream_digest(f):
+    """
+    Return the sha256 of a binary file object from its current position
+    on, which is restored afterwards.
+    """
+    position = f.tell()
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+        digest.update(chunk)
+    f.seek(position)
+    return digest.hexdigest()
+
+
+def stream_size(f):
+    position = f.tell()
+    f.seek(0, os.SEEK_END)
+    size = f.tell() - position
+    f.seek(position)
+    return size
+
+
+def cache_key(dfile):
+    """
+    Return the cache key of an OH data file, based on its metadata.
+    """
+    if 'sha256' in dfile['metadata']:
+        return dfile['metadata']['sha256']
+    return 'file-{}'.format(dfile['id'])
+
+
+def cached_path(oh_id, key):
+    return os.path.join(settings.RESCUETIME_CACHE_DIR, str(oh_id),
+                        '{}.json'.format(key))
+
+
+def get_cached_file(oh_id, key):
+    """
+    Return the path of a cached file or None if it isn't cached.
+    """
+    path = cached_path(oh_id, key)
+    if os.path.exists(path):
+        # mark as recently used, the index too so it isn't evicted first
+        os.utime(path, None)
+        try:
+            os.utime(index_path(path), None)
+        except FileNotFoundError:
+            pass
+        return path
+    return None
+
+
+def remove_member(oh_id):
+    """
+    Remove all cached files of a member.
+    """
+    shutil.rmtree(os.path.join(settings.RESCUETIME_CACHE_DIR, str(oh_id)),
+                  ignore_errors=True)
+
+
+def index_path(path):
+    return path + '.index'
+
+
+def load_index(path):
+    """
+    Return the day index of a cached file, building it if necessary.
+    """
+    try:
+        with open(index_path(path)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        pass
+    with open(path, newline='') as f:
+        index = build_index(f)
+    _write_index(path, index)
+    return index
+
+
+def _write_index(path, index):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path(path))
+
+
+def add_file(oh_id, key, source_path, index=None):
+    """
+    Copy a local file (and its index, if known) into the cache.
+    """
+    with open(source_path, 'rb') as source:
+        path = _store(oh_id, key, lambda f: shutil.copyfileobj(source, f))
+    if index is not None:
+        _write_index(path, index)
+    return path
+
+
+def download(url, output_format, target):
+    """
+    Download a file in the given output format (see formats.py) and write
+    it decoded into the binary file object target.
+    """
+    response = get_session().get(url, stream=True)
+    response.raise_for_status()
+    with tempfile.TemporaryFile() as downloaded:
+        for chunk in response.iter_content(chunk_size=1024 * 1024):
+            downloaded.write(chunk)
+        metrics.inc('rescuetime_bytes_downloaded_total', downloaded.tell())
+        downloaded.seek(0)
+        out = io.TextIOWrapper(target, encoding='utf-8', newline='')
+        decode(output_format, downloaded, out)
+        out.flush()
+        out.detach()
+
+
+def _store(oh_id, key, write):
+    path = cached_path(oh_id, key)
+    member_directory = os.path.dirname(path)
+    os.makedirs(member_directory, exist_ok=True)
+    # write to a temporary file first so readers never see partial files
+    fd, tmp_path = tempfile.mkstemp(dir=member_directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
+    for filename in os.listdir(member_directory):
+        if filename.startswith(key + '.') or filename.endswith('.tmp'):
+            continue
+        os.remove(os.path.join(member_directory, filename))
+    evict(keep=path)
+    return path
+
+
+def evict(max_bytes=None, keep=None):
+    """
+    Remove the least recently used files until the cache fits max_bytes.
+    The file at keep (and its index) is never removed, even if it alone
+    is larger than max_bytes.
+    """
+    if max_bytes is None:
+        max_bytes = settings.RESCUETIME_CACHE_MAX_BYTES
+    entries = []
+    for directory, _, filenames in os.walk(settings.RESCUETIME_CACHE_DIR):
+        for filename in filenames:
+            if filename.endswith('.tmp'):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if keep is not None and path in (keep, index_path(keep)):
+            continue
+        for evicted_path in (path, index_path(path)):
+            try:
+                os.remove(evicted_path)
+                logger.debug('evicted {} from cache'.format(evicted_path))
+            except FileNotFoundError:
+                pass
+        total -= size
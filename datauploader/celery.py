@@ -17,6 +17,13 @@ from django.conf import settings
 
 CELERY_BROKER_URL = os.getenv('REDIS_URL')
 
+# Updates a member asked for (or just connected) go to their own queue, so
+# they don't wait behind the nightly updates or behind long imports of the
+# whole history. Each queue has its own workers, see the Procfile.
+INTERACTIVE_QUEUE = 'interactive'
+SCHEDULED_QUEUE = 'scheduled'
+BACKFILL_QUEUE = 'backfill'
+
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE',
                       'demotemplate.settings')
@@ -32,6 +39,13 @@ app.conf.update({
     'CELERY_RESULT_BACKEND': CELERY_BROKER_URL,
     'CELERY_SEND_EVENTS': False,
     'CELERY_EVENT_QUEUE_EXPIRES': 60,
+    'CELERY_DEFAULT_QUEUE': SCHEDULED_QUEUE,
+    'CELERY_ROUTES': {
+        'datauploader.tasks.process_rescuetime': {'queue': SCHEDULED_QUEUE},
+    },
+    # updates take minutes, a worker shouldn't hold on to queued ones
+    # that another worker could start right away
+    'CELERYD_PREFETCH_MULTIPLIER': 1,
 })
 
 
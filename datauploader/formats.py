@@ -0,0 +1,158 @@
+"""
+Output formats of the rescuetime file that is uploaded to Open Humans.
+
+Locally (in the cache) a member's data is always kept as a plain
+rescuetime.json file. Before uploading it is encoded into the format set
+in RESCUETIME_OUTPUT_FORMAT, and after downloading it is decoded back.
+The format of an uploaded file is stored in its metadata.
+
+  json       the plain rescuetime.json file, like the RescueTime API returns
+  json.gz    the same, gzip compressed
+  ndjson.gz  one JSON object with everything but the rows on the first
+             line, followed by one row per line, gzip compressed
+  csv.gz     one JSON object with everything but the rows on the first
+             line, a CSV line with the row headers, followed by one CSV
+             row per line, gzip compressed. Numeric columns hold JSON
+             values, in the other columns null is written as \\N and a
+             leading backslash is doubled.
+"""
+import csv
+import gzip
+import io
+import json
+import shutil
+from datauploader.streaming import read_rescuetime, write_rescuetime
+
+DEFAULT_FORMAT = 'json'
+
+EXTENSIONS = {
+    'json': '.json',
+    'json.gz': '.json.gz',
+    'ndjson.gz': '.ndjson.gz',
+    'csv.gz': '.csv.gz',
+}
+
+FILENAMES = {output_format: 'rescuetime' + extension
+             for output_format, extension in EXTENSIONS.items()}
+
+DESCRIPTIONS = {
+    'json': 'JSON object with the keys notes, row_headers and rows.',
+    'json.gz': ('gzip compressed JSON object with the keys notes, '
+                'row_headers and rows.'),
+    'ndjson.gz': ('gzip compressed newline delimited JSON. The first line '
+                  'holds notes and row_headers, every other line is a row.'),
+    'csv.gz': ('gzip compressed CSV. The first line is a JSON object with '
+               'notes and row_headers, the second line holds the row '
+               'headers, every other line is a row. Null values are \\N.'),
+}
+
+# columns of the RescueTime API that hold numbers, the others hold text
+NUMERIC_HEADERS = {'Time Spent (seconds)', 'Number of People', 'Productivity'}
+
+
+def filename(output_format, name='rescuetime'):
+    if output_format not in EXTENSIONS:
+        raise ValueError('unknown output format {!r}'.format(output_format))
+    return name + EXTENSIONS[output_format]
+
+
+def file_format(dfile):
+    """
+    Return the format of an OH data file, files without a format in
+    their metadata are plain json.
+    """
+    return dfile['metadata'].get('format', DEFAULT_FORMAT)
+
+
+def encode(output_format, source_path, target):
+    """
+    Encode the rescuetime.json file at source_path into output_format,
+    written to the binary file object target.
+    """
+    filename(output_format)
+    if output_format == 'json':
+        with open(source_path, 'rb') as source:
+            shutil.copyfileobj(source, target)
+        return
+    # a fixed mtime keeps the output (and its digest) the same for the
+    # same data
+    with gzip.GzipFile(fileobj=target, mode='wb', mtime=0) as gz, \
+            io.TextIOWrapper(gz, encoding='utf-8', newline='') as out, \
+            open(source_path, newline='') as source:
+        if output_format == 'json.gz':
+            shutil.copyfileobj(source, out)
+            return
+        header, rows = read_rescuetime(source)
+        if output_format == 'ndjson.gz':
+            out.write(json.dumps(header) + '\n')
+            for row in rows:
+                out.write(json.dumps(row) + '\n')
+        else:
+            row_headers = header.get('row_headers', [])
+            numeric = _numeric_columns(row_headers)
+            out.write(json.dumps(header) + '\n')
+            writer = csv.writer(out)
+            writer.writerow(row_headers)
+            for row in rows:
+                writer.writerow([_csv_cell(value, i in numeric)
+                                 for i, value in enumerate(row)])
+
+
+def _numeric_columns(row_headers):
+    return {i for i, name in enumerate(row_headers)
+            if name in NUMERIC_HEADERS}
+
+
+def _csv_cell(value, numeric):
+    if numeric:
+        return json.dumps(value)
+    if value is None:
+        return '\\N'
+    if not isinstance(value, str):
+        # not expected in a text column, kept as JSON
+        return '\\J' + json.dumps(value)
+    if value.startswith('\\'):
+        return '\\' + value
+    return value
+
+
+def _csv_value(cell, numeric):
+    if numeric:
+        return json.loads(cell)
+    if cell == '\\N':
+        return None
+    if cell.startswith('\\J'):
+        return json.loads(cell[2:])
+    if cell.startswith('\\'):
+        return cell[1:]
+    return cell
+
+
+def decode(output_format, source, target):
+    """
+    Decode the binary file object source from output_format into a plain
+    rescuetime.json, written to the text file object target.
+    """
+    filename(output_format)
+    if output_format == 'json':
+        data = io.TextIOWrapper(source, encoding='utf-8', newline='')
+        shutil.copyfileobj(data, target)
+        data.detach()
+        return
+    with gzip.GzipFile(fileobj=source, mode='rb') as gz, \
+            io.TextIOWrapper(gz, encoding='utf-8', newline='') as data:
+        if output_format == 'json.gz':
+            shutil.copyfileobj(data, target)
+        elif output_format == 'ndjson.gz':
+            header = json.loads(next(data))
+            write_rescuetime(target, header,
+                             (json.loads(line) for line in data if line))
+        else:
+            header = json.loads(next(data))
+            numeric = _numeric_columns(header.get('row_headers', []))
+            reader = csv.reader(data)
+            next(reader, None)
+            write_rescuetime(target, header,
+                             ([_csv_value(cell, i in numeric)
+                               for i, cell in enumerate(row)]
+                              for row in reader))
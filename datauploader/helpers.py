@@ -0,0 +1,99 @@
+"""
+Helpers for the datauploader tasks that keep state in Redis.
+"""
+import json
+from django.conf import settings
+from redis import StrictRedis
+from redis.exceptions import LockError
+from datauploader.celery import INTERACTIVE_QUEUE
+from datauploader.rows import RowStore
+
+redis = StrictRedis.from_url(settings.REDIS_URL)
+
+CHECKPOINT_KEY = 'rescuetime:checkpoint:{}'
+# retries happen within minutes, stale checkpoints can expire after a week
+CHECKPOINT_EXPIRY = 7 * 24 * 60 * 60
+
+# at most one update per member is queued (SYNC_QUEUED_KEY) or running
+# (SYNC_LOCK_KEY) at any time
+SYNC_LOCK_KEY = 'rescuetime:lock:{}'
+SYNC_QUEUED_KEY = 'rescuetime:queued:{}'
+# an update takes minutes, the keys only expire in case a worker dies. A
+# long update extends its lock after every window (see extend_sync_lock)
+SYNC_LOCK_EXPIRY = 60 * 60
+SYNC_QUEUED_EXPIRY = 60 * 60
+
+
+def load_checkpoint(oh_id, start_date):
+    """
+    Return the checkpoint of an interrupted update that started at
+    start_date. If there is none a fresh checkpoint is returned.
+    """
+    checkpoint = redis.get(CHECKPOINT_KEY.format(oh_id))
+    if checkpoint is not None:
+        checkpoint = json.loads(checkpoint.decode('utf-8'))
+        if checkpoint['start_date'] == start_date:
+            checkpoint['rows'] = RowStore.from_json(checkpoint['rows'])
+            return checkpoint
+    return {'start_date': start_date, 'cursor': start_date,
+            'header': {}, 'rows': RowStore()}
+
+
+def save_checkpoint(oh_id, checkpoint):
+    checkpoint = dict(checkpoint, rows=checkpoint['rows'].to_json())
+    redis.setex(CHECKPOINT_KEY.format(oh_id),
+                CHECKPOINT_EXPIRY,
+                json.dumps(checkpoint))
+
+
+def clear_checkpoint(oh_id):
+    redis.delete(CHECKPOINT_KEY.format(oh_id))
+
+
+def claim_queued(oh_id, countdown=0, retry=False, queue=None):
+    """
+    Mark an update of oh_id as queued. Returns False if an update is
+    queued or running already. A retry from within the running update only
+    checks for a queued one. An update for the interactive queue is queued
+    anyway if only an update in another queue is, which then finds the
+    data up to date.
+    """
+    if not retry and redis.exists(SYNC_LOCK_KEY.format(oh_id)):
+        return False
+    key = SYNC_QUEUED_KEY.format(oh_id)
+    expiry = int(countdown) + SYNC_QUEUED_EXPIRY
+    if redis.set(key, queue or '', nx=True, ex=expiry):
+        return True
+    if queue != INTERACTIVE_QUEUE:
+        return False
+    queued = redis.getset(key, queue)
+    redis.expire(key, expiry)
+    return queued is None or queued.decode('utf-8') != queue
+
+
+def acquire_sync_lock(oh_id):
+    """
+    Return the lock for running an update of oh_id, or None if another
+    update holds it.
+    """
+    lock = redis.lock(SYNC_LOCK_KEY.format(oh_id), timeout=SYNC_LOCK_EXPIRY)
+    if not lock.acquire(blocking=False):
+        return None
+    redis.delete(SYNC_QUEUED_KEY.format(oh_id))
+    return lock
+
+
+def extend_sync_lock(lock):
+    """
+    Reset the expiry of a held lock to SYNC_LOCK_EXPIRY. Raises LockError
+    if it expired in the meantime.
+    """
+    lock.reacquire()
+
+
+def release_sync_lock(lock):
+    try:
+        lock.release()
+    except LockError:
+        # it expired, and may be held by another update by now
+        pass
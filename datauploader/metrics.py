@@ -0,0 +1,111 @@
+"""
+Metrics of the updates: how long their phases take, how much data they
+move and how long they wait in their queue. All workers add to the same
+Redis hash, which the /metrics view renders in the Prometheus text format.
+"""
+import logging
+import re
+import time
+from contextlib import contextmanager
+from datauploader.helpers import redis
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = 'rescuetime:metrics'
+# from a quick refresh to the import of years of data
+BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+METRICS = {
+    'rescuetime_phase_seconds':
+        ('histogram', 'Time spent in each phase of an update.'),
+    'rescuetime_queue_lag_seconds':
+        ('histogram', 'Time an update waited in its queue after it was due.'),
+    'rescuetime_updates_total':
+        ('counter', 'Finished updates by their result.'),
+    'rescuetime_windows_total':
+        ('counter', 'Windows fetched from RescueTime.'),
+    'rescuetime_rows_fetched_total':
+        ('counter', 'Rows fetched from RescueTime.'),
+    'rescuetime_bytes_downloaded_total':
+        ('counter', 'Bytes of data files downloaded from Open Humans.'),
+    'rescuetime_bytes_uploaded_total':
+        ('counter', 'Bytes of data files uploaded to Open Humans.'),
+}
+
+_le = re.compile(r',?le="([^"]*)"')
+
+
+def _series(name, labels):
+    if not labels:
+        return name
+    return '{}{{{}}}'.format(name, ','.join(
+        '{}="{}"'.format(label, value)
+        for label, value in sorted(labels.items())))
+
+
+def _record(increments):
+    # metrics are never worth failing an update for
+    try:
+        pipeline = redis.pipeline(transaction=False)
+        for series, value in increments:
+            pipeline.hincrbyfloat(METRICS_KEY, series, value)
+        pipeline.execute()
+    except:
+        logger.debug('could not record metrics')
+
+
+def inc(name, value=1, **labels):
+    _record([(_series(name, labels), value)])
+
+
+def observe(name, value, **labels):
+    increments = [(_series(name + '_sum', labels), value),
+                  (_series(name + '_count', labels), 1)]
+    for bound in BUCKETS + ('+Inf',):
+        if bound == '+Inf' or value <= bound:
+            increments.append(
+                (_series(name + '_bucket', dict(labels, le=bound)), 1))
+    _record(increments)
+
+
+@contextmanager
+def timed(phase):
+    start = time.time()
+    try:
+        yield
+    finally:
+        observe('rescuetime_phase_seconds', time.time() - start, phase=phase)
+
+
+def _sort_key(series):
+    # buckets in the order of their bounds, not alphabetically
+    match = _le.search(series)
+    return (_le.sub('', series), float(match.group(1)) if match else 0)
+
+
+def _format_value(value):
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def format_metrics(values):
+    """
+    Render a dict of series and their values in the Prometheus text format.
+    """
+    lines = []
+    for name in sorted(METRICS):
+        kind, description = METRICS[name]
+        names = {name, name + '_sum', name + '_count', name + '_bucket'}
+        series = [s for s in values if s.split('{')[0] in names]
+        if not series:
+            continue
+        lines.append('# HELP {} {}'.format(name, description))
+        lines.append('# TYPE {} {}'.format(name, kind))
+        for s in sorted(series, key=_sort_key):
+            lines.append('{} {}'.format(s, _format_value(values[s])))
+    return ''.join(line + '\n' for line in lines)
+
+
+def render():
+    values = {series.decode('utf-8'): float(value)
+              for series, value in redis.hgetall(METRICS_KEY).items()}
+    return format_metrics(values)
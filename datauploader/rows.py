@@ -0,0 +1,248 @@
+"""
+Compact, column oriented storage of RescueTime rows.
+
+A row as returned by the RescueTime API looks like
+["2016-06-01T10:05:00", 60, 1, "github.com", "General Software Development", 2]
+Keeping millions of these as lists costs an object per field. A RowStore
+keeps the timestamps as integers (seconds since the epoch) and every other
+column either as an array of integers or, for strings and other values, as
+an array of indexes into a table of interned values.
+
+Rows are identified by their timestamp and activity. Rows with the same
+key are duplicates, e.g. from overlapping or retried windows, and the row
+fetched last wins when merging.
+"""
+from array import array
+import calendar
+import heapq
+import json
+import time
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+INT_COLUMN = 'int'
+VALUE_COLUMN = 'value'
+
+# rows sorted at once by iter_unique, the sorted runs are merged lazily
+SORT_CHUNK_SIZE = 65536
+
+
+def parse_timestamp(value):
+    """
+    Convert '2016-06-01T10:05:00' to seconds since the epoch.
+    """
+    if len(value) != 19 or value[10] != 'T':
+        raise ValueError('unexpected timestamp {!r}'.format(value))
+    return calendar.timegm((int(value[0:4]), int(value[5:7]),
+                            int(value[8:10]), int(value[11:13]),
+                            int(value[14:16]), int(value[17:19]), 0, 0, 0))
+
+
+def format_timestamp(timestamp):
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(timestamp))
+
+
+def key_column(header):
+    """
+    Return the index of the column that identifies a row together with
+    its timestamp. None means that the whole row is used.
+    """
+    row_headers = header.get('row_headers', [])
+    if 'Activity' in row_headers:
+        return row_headers.index('Activity')
+    return None
+
+
+def row_key(row, column):
+    value = row[1:] if column is None else row[column]
+    return parse_timestamp(row[0]), json.dumps(value)
+
+
+def merge_sorted(old, new):
+    """
+    Merge two iterables of (key, row) pairs that are sorted by key into
+    one sorted iterator of rows in a single pass. If both contain a key,
+    the row of new is used.
+    """
+    old = iter(old)
+    new = iter(new)
+    old_item = next(old, None)
+    new_item = next(new, None)
+    while old_item is not None or new_item is not None:
+        if new_item is None or (old_item is not None and
+                                old_item[0] < new_item[0]):
+            yield old_item[1]
+            old_item = next(old, None)
+        else:
+            if old_item is not None and old_item[0] == new_item[0]:
+                old_item = next(old, None)
+            yield new_item[1]
+            new_item = next(new, None)
+
+
+def _is_int(value):
+    return type(value) == int and -2 ** 63 <= value < 2 ** 63
+
+
+class RowStore(object):
+    """
+    Columnar list of RescueTime rows. Rows are appended as lists and read
+    back as lists, but stored as one array per column.
+    """
+
+    def __init__(self):
+        self.timestamps = array('q')
+        # one (kind, array) pair per column after the timestamp
+        self.columns = None
+        self.values = []
+        self._value_index = {}
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def _intern(self, value):
+        key = (type(value).__name__, value)
+        index = self._value_index.get(key)
+        if index is None:
+            index = len(self.values)
+            self.values.append(value)
+            self._value_index[key] = index
+        return index
+
+    def _to_value_column(self, column):
+        kind, data = self.columns[column]
+        self.columns[column] = (VALUE_COLUMN,
+                                array('l', map(self._intern, data)))
+
+    def append(self, row):
+        if self.columns is None:
+            self.columns = [(INT_COLUMN if _is_int(value) else VALUE_COLUMN,
+                             array('q') if _is_int(value) else array('l'))
+                            for value in row[1:]]
+        if len(row) != len(self.columns) + 1:
+            raise ValueError('expected {} columns but got {!r}'.format(
+                len(self.columns) + 1, row))
+        self.timestamps.append(parse_timestamp(row[0]))
+        for column, value in enumerate(row[1:]):
+            kind, data = self.columns[column]
+            if kind == INT_COLUMN:
+                if _is_int(value):
+                    data.append(value)
+                    continue
+                self._to_value_column(column)
+                kind, data = self.columns[column]
+            data.append(self._intern(value))
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def row(self, i):
+        row = [format_timestamp(self.timestamps[i])]
+        for kind, data in self.columns:
+            if kind == INT_COLUMN:
+                row.append(data[i])
+            else:
+                row.append(self.values[data[i]])
+        return row
+
+    def _value_keys(self, column):
+        """
+        Return the JSON key of every distinct value of the key column and
+        its rank among these keys, both by the number stored in the column.
+        """
+        kind, data = self.columns[column - 1]
+        if kind == INT_COLUMN:
+            keys = {value: json.dumps(value) for value in set(data)}
+        else:
+            keys = {index: json.dumps(self.values[index])
+                    for index in set(data)}
+        rank = {key: i for i, key in enumerate(sorted(set(keys.values())))}
+        return keys, {value: rank[key] for value, key in keys.items()}
+
+    def _iter_unique_rows(self):
+        keys = [(self.timestamps[i], json.dumps(self.row(i)[1:]))
+                for i in range(len(self))]
+        # sorting is stable, so duplicates stay in the order they came in
+        order = sorted(range(len(self)), key=keys.__getitem__)
+        for position, i in enumerate(order):
+            if (position + 1 < len(order) and
+                    keys[order[position + 1]] == keys[i]):
+                continue
+            yield keys[i], self.row(i)
+
+    def iter_unique(self, column):
+        """
+        Yield (key, row) pairs sorted by key, see row_key. Rows can be
+        appended in any order; of rows with the same key only the one that
+        was appended last is returned.
+        """
+        if not len(self):
+            return
+        if column is None:
+            yield from self._iter_unique_rows()
+            return
+        _, data = self.columns[column - 1]
+        value_keys, ranks = self._value_keys(column)
+        # sort one integer per row, (timestamp, rank of the value, index),
+        # instead of a (timestamp, JSON string) tuple; the JSON keys are
+        # only built once per distinct value
+        count = len(self)
+        start = min(self.timestamps)
+        packed = ((max(self.timestamps) - start + 1) * len(ranks) * count <
+                  2 ** 63)
+
+        def sort_key(i):
+            return ((self.timestamps[i] - start) * len(ranks) +
+                    ranks[data[i]]) * count + i
+
+        chunks = []
+        for offset in range(0, count, SORT_CHUNK_SIZE):
+            chunk = sorted(map(sort_key, range(
+                offset, min(offset + SORT_CHUNK_SIZE, count))))
+            chunks.append(array('q', chunk) if packed else chunk)
+        last = None
+        for key in heapq.merge(*chunks):
+            # of keys with the same row key the last index comes last
+            if last is not None and key // count != last // count:
+                yield self._unique_item(last % count, data, value_keys)
+            last = key
+        yield self._unique_item(last % count, data, value_keys)
+
+    def _unique_item(self, i, data, value_keys):
+        return (self.timestamps[i], value_keys[data[i]]), self.row(i)
+
+    def truncate(self, length):
+        """
+        Drop all rows from index length on.
+        """
+        del self.timestamps[length:]
+        for _, data in self.columns or []:
+            del data[length:]
+
+    def to_json(self):
+        """
+        Return a JSON serializable, still columnar, copy of the store.
+        """
+        return {
+            'timestamps': self.timestamps.tolist(),
+            'columns': [[kind, data.tolist()]
+                        for kind, data in self.columns or []],
+            'values': self.values,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        store = cls()
+        store.timestamps = array('q', data['timestamps'])
+        if data['columns']:
+            store.columns = [
+                (kind, array('q' if kind == INT_COLUMN else 'l', values))
+                for kind, values in data['columns']]
+        for value in data['values']:
+            store._intern(value)
+        return store
@@ -0,0 +1,292 @@
+"""
+Streaming reading and writing of rescuetime.json files.
+
+A rescuetime.json file is a single JSON object like the ones returned by
+the RescueTime API, e.g. {"notes": ..., "row_headers": [...], "rows": [...]}.
+The rows are read and written one at a time, so memory use doesn't depend
+on the number of rows in a file.
+
+Files are always opened with newline='', so that offsets into a file are
+plain character offsets. For every file we keep an index with the offsets
+of the first row of each day:
+
+    {'days': [[day, offset], ...], 'rows_open': ..., 'rows_end': ...,
+     'rows_close': ...}
+
+where day is the timestamp of midnight of that day and offset points just
+behind the previous row (or behind the "[" for the first row). rows_open
+points behind the "[" of the rows, rows_end behind the last row and
+rows_close at the closing "]". With it a file can be cut at any day
+without parsing its rows.
+"""
+from bisect import bisect_left
+from itertools import chain
+from operator import itemgetter
+import json
+from datauploader.rows import parse_timestamp, row_key, merge_sorted
+
+DAY = 24 * 60 * 60
+
+CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+_whitespace = ' \t\n\r'
+
+
+class _Reader(object):
+    """
+    Incremental tokenizer over a text file that holds one JSON object.
+    """
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.consumed = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.consumed += self.pos
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def offset(self):
+        return self.consumed + self.pos
+
+    def peek(self):
+        """
+        Return the next non-whitespace character ('' at the end of file).
+        """
+        while True:
+            while (self.pos < len(self.buffer) and
+                   self.buffer[self.pos] in _whitespace):
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self._fill()
+
+    def expect(self, characters):
+        character = self.peek()
+        if character == '' or character not in characters:
+            raise ValueError('expected one of {!r} but found {!r}'.format(
+                characters, character))
+        self.pos += 1
+        return character
+
+    def value(self):
+        """
+        Decode the next complete JSON value.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+                self._fill()
+                continue
+            # a number at the end of the buffer might continue in the file
+            if end == len(self.buffer) and not self.eof:
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+
+def read_rescuetime(f):
+    """
+    Read a rescuetime.json file object incrementally.
+
+    Returns (header, rows), where header is a dict of all keys that come
+    before "rows" in the file and rows is a generator over the rows. Keys
+    that come after "rows" are added to header once rows is exhausted.
+    """
+    reader = _Reader(f)
+    header = {}
+    reader.expect('{')
+
+    def items():
+        if reader.peek() == '}':
+            reader.expect('}')
+            return
+        while True:
+            key = reader.value()
+            reader.expect(':')
+            if key == 'rows':
+                reader.expect('[')
+                if reader.peek() == ']':
+                    reader.expect(']')
+                else:
+                    while True:
+                        yield reader.value()
+                        if reader.expect(',]') == ']':
+                            break
+            else:
+                header[key] = reader.value()
+            if reader.expect(',}') == '}':
+                return
+
+    rows = items()
+    # read up to the first row, so the header is complete
+    try:
+        first_row = next(rows)
+    except StopIteration:
+        return header, iter([])
+
+    def all_rows():
+        yield first_row
+        for row in rows:
+            yield row
+
+    return header, all_rows()
+
+
+class _CountingWriter(object):
+
+    def __init__(self, f):
+        self.f = f
+        self.offset = 0
+
+    def write(self, text):
+        self.f.write(text)
+        self.offset += len(text)
+
+
+def _write_rows(out, rows, index):
+    """
+    Append rows to the rows of a file that is being written, updating the
+    index of the file.
+    """
+    last_day = index['days'][-1][0] if index['days'] else None
+    for row in rows:
+        day = parse_timestamp(row[0]) // DAY * DAY
+        if last_day is not None and day < last_day:
+            raise ValueError('rows are not sorted by date at {!r}'.format(
+                row[0]))
+        if day != last_day:
+            index['days'].append([day, index['rows_end']])
+            last_day = day
+        if index['rows_end'] != index['rows_open']:
+            out.write(', ')
+        out.write(json.dumps(row))
+        index['rows_end'] = out.offset
+
+
+def write_rescuetime(f, header, rows):
+    """
+    Write header and rows (sorted by date) to a text file object as a
+    single JSON object, with the rows written last and one at a time.
+    Returns the index of the written file.
+    """
+    out = _CountingWriter(f)
+    out.write('{')
+    for key, value in header.items():
+        if key == 'rows':
+            continue
+        out.write('{}: {}, '.format(json.dumps(key), json.dumps(value)))
+    out.write('"rows": [')
+    index = {'days': [], 'rows_open': out.offset, 'rows_end': out.offset}
+    _write_rows(out, rows, index)
+    index['rows_close'] = out.offset
+    out.write(']}')
+    return index
+
+
+def _copy(source, out, length):
+    while length > 0:
+        chunk = source.read(min(length, CHUNK_SIZE))
+        if not chunk:
+            raise ValueError('file is shorter than its index')
+        out.write(chunk)
+        length -= len(chunk)
+
+
+def write_merged_rescuetime(f, existing, index, rows, column):
+    """
+    Write the existing file (a text file object) merged with rows, an
+    iterable of (key, row) pairs sorted by key (see rows.row_key with the
+    given key column). Existing rows before the day of the first new row
+    are copied as they are, without parsing them. The existing rows from
+    that day on are merged with the new rows by key, replacing existing
+    rows with the same key. Returns the index of the written file.
+    """
+    out = _CountingWriter(f)
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        _copy_rest(existing, out)
+        return index
+    index = trim_index(index, first[0][0] // DAY * DAY)
+    index['days'] = [list(day) for day in index['days']]
+    _copy(existing, out, index['rows_end'])
+    tail = existing.read(index['rows_close'] - index['rows_end'])
+    tail = json.loads('[' + tail.strip().lstrip(',') + ']')
+    tail = sorted(((row_key(row, column), row) for row in tail),
+                  key=itemgetter(0))
+    _write_rows(out, merge_sorted(tail, chain([first], rows)), index)
+    index['rows_close'] = out.offset
+    _copy_rest(existing, out)
+    return index
+
+
+def _copy_rest(source, out):
+    for chunk in iter(lambda: source.read(CHUNK_SIZE), ''):
+        out.write(chunk)
+
+
+def trim_index(index, day):
+    """
+    Return the index of the file without all rows from day on. The cut
+    point is found with a binary search over the days of the index, day
+    doesn't need to be present in the file.
+    """
+    days = index['days']
+    i = bisect_left(days, [day])
+    rows_end = days[i][1] if i < len(days) else index['rows_end']
+    return dict(index, days=days[:i], rows_end=rows_end)
+
+
+def build_index(f):
+    """
+    Build the index of a rescuetime.json text file object by reading it
+    once. Returns None if the file has no rows.
+    """
+    reader = _Reader(f)
+    reader.expect('{')
+    index = None
+    if reader.peek() == '}':
+        return index
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key == 'rows':
+            reader.expect('[')
+            index = {'days': [], 'rows_open': reader.offset(),
+                     'rows_end': reader.offset()}
+            last_day = None
+            if reader.peek() != ']':
+                while True:
+                    row = reader.value()
+                    day = parse_timestamp(row[0]) // DAY * DAY
+                    if last_day is not None and day < last_day:
+                        raise ValueError(
+                            'rows are not sorted by date at {!r}'.format(
+                                row[0]))
+                    if day != last_day:
+                        index['days'].append([day, index['rows_end']])
+                        last_day = day
+                    index['rows_end'] = reader.offset()
+                    if reader.expect(',]') == ']':
+                        break
+            else:
+                reader.expect(']')
+            index['rows_close'] = reader.offset() - 1
+        else:
+            reader.value()
+        if reader.expect(',}') == '}':
+            return index
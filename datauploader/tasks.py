@@ -1,16 +1,29 @@
 """
 Asynchronous tasks that update data in Open Humans.
 These tasks:
-  1. delete any current files in OH if they match the planned upload filename
-  2. adds a data file
+  1. upload the new data file (or a delta file, see upload_delta)
+  2. delete the files it supersedes by their id afterwards
 """
+import io
 import logging
-import json
 import tempfile
-import requests
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import partial
 from celery import shared_task
 from django.conf import settings
+from demotemplate.settings import rr
+from datauploader.helpers import (load_checkpoint, save_checkpoint,
+                                  clear_checkpoint, claim_queued,
+                                  acquire_sync_lock, extend_sync_lock,
+                                  release_sync_lock)
+from datauploader.windows import WindowPlanner
+from datauploader import cache, formats, metrics
+from datauploader.celery import SCHEDULED_QUEUE, BACKFILL_QUEUE
+from datauploader.streaming import (read_rescuetime, write_rescuetime,
+                                    write_merged_rescuetime, build_index)
+from datauploader.rows import RowStore, format_timestamp, key_column
 from open_humans.models import OpenHumansMember
 from datetime import datetime, timedelta
 from ohapi import api
@@ -21,113 +34,480 @@ logger = logging.getLogger(__name__)
 
 RESCUETIME_API = ('https://www.rescuetime.com/api/oauth/data'
                   '?perspective=interval&interval=minute&format=json&')
+# monthly totals per category, used to find the first month with data
+RESCUETIME_PROBE_API = ('https://www.rescuetime.com/api/oauth/data'
+                        '?perspective=interval&interval=month'
+                        '&restrict_kind=overview&format=json&')
+# RescueTime didn't exist before this date
+RESCUETIME_EPOCH = '2008-01-01'
+
+
+def update_queue(last_uploaded, queue=SCHEDULED_QUEUE):
+    """
+    Return the queue for an update of a member: queue, unless nothing was
+    ever uploaded for the member (last_uploaded of its DataSourceMember is
+    None). Then all of its data needs to be imported, in the backfill
+    queue.
+    """
+    return queue if last_uploaded else BACKFILL_QUEUE
+
+
+def enqueue_rescuetime(oh_id, countdown=0, retry=False,
+                       queue=SCHEDULED_QUEUE):
+    """
+    Queue an update of the rescuetime file for a given OH user, unless one
+    is queued or running already. Returns whether it was queued.
+    """
+    if not claim_queued(oh_id, countdown, retry, queue):
+        logger.debug('update for {} is already queued'.format(oh_id))
+        return False
+    process_rescuetime.apply_async(args=[oh_id],
+                                   kwargs={'due_at': time.time() + countdown},
+                                   countdown=countdown, queue=queue)
+    return True
 
 
 @shared_task
-def process_rescuetime(oh_id):
+def process_rescuetime(oh_id, due_at=None):
     """
     Update the rescuetime file for a given OH user
     """
-    logger.debug('Starting rescuetime processing for {}'.format(oh_id))
-    oh_member = OpenHumansMember.objects.get(oh_id=oh_id)
-    oh_access_token = oh_member.get_access_token(
+    if due_at is not None:
+        delivery_info = process_rescuetime.request.delivery_info or {}
+        metrics.observe('rescuetime_queue_lag_seconds',
+                        max(0, time.time() - due_at),
+                        queue=delivery_info.get('routing_key', ''))
+    lock = acquire_sync_lock(oh_id)
+    if lock is None:
+        logger.debug('update for {} is already running'.format(oh_id))
+        metrics.inc('rescuetime_updates_total', result='duplicate')
+        return
+    try:
+        with metrics.timed('total'):
+            logger.debug('Starting rescuetime processing for {}'.format(
+                oh_id))
+            oh_member = OpenHumansMember.objects.get(oh_id=oh_id)
+            oh_access_token = oh_member.get_access_token(
                             client_id=settings.OPENHUMANS_CLIENT_ID,
                             client_secret=settings.OPENHUMANS_CLIENT_SECRET)
-    rescuetime_data = get_existing_rescuetime(oh_access_token)
-    rescuetime_member = oh_member.datasourcemember
-    rescuetime_access_token = rescuetime_member.access_token
-    print('start update_rescuetime')
-    update_rescuetime(oh_member, rescuetime_access_token, rescuetime_data)
+            with metrics.timed('download'):
+                existing = get_existing_rescuetime(oh_access_token)
+            rescuetime_member = oh_member.datasourcemember
+            rescuetime_access_token = rescuetime_member.access_token
+            print('start update_rescuetime')
+            extend_sync_lock(lock)
+            update_rescuetime(oh_member, rescuetime_access_token, existing,
+                              lock)
+    finally:
+        release_sync_lock(lock)
 
 
-def update_rescuetime(oh_member, rescuetime_access_token, rescuetime_data):
+def update_rescuetime(oh_member, rescuetime_access_token, existing,
+                      lock=None):
+    checkpoint = None
     try:
-        start_date = get_start_date(rescuetime_data, rescuetime_access_token)
-        rescuetime_data = remove_partial_data(rescuetime_data, start_date)
+        start_date = get_start_date(existing['index'],
+                                    rescuetime_access_token)
+        checkpoint = load_checkpoint(oh_member.oh_id, start_date)
         stop_date = datetime.utcnow()
-        start_date = datetime.strptime(start_date, '%Y-%m-%d')
-        while start_date < stop_date:
-            print('processing {} for member {}'.format(start_date,
-                                                       oh_member.oh_id))
-            query = RESCUETIME_API + \
-                'access_token={}&restrict_begin={}&restrict_end={}'.format(
-                  rescuetime_access_token,
-                  datetime.strftime(start_date, "%Y-%m-%d"),
-                  datetime.strftime(start_date + timedelta(days=14),
-                                    "%Y-%m-%d"),
-                )
-            response = requests.get(query)
-            response_json = response.json()
-            if rescuetime_data == {}:
-                rescuetime_data = response_json
-            else:
-                rescuetime_data['rows'] += response_json['rows']
-            start_date = start_date + timedelta(days=15)
-        print('successfully finished update for {}'.format(oh_member.oh_id))
-        rescuetime_member = oh_member.datasourcemember
-        rescuetime_member.last_updated = arrow.now().format()
-        rescuetime_member.save()
+        cursor = datetime.strptime(checkpoint['cursor'], '%Y-%m-%d')
+        planner = WindowPlanner(
+            cursor, stop_date,
+            target_rows=settings.RESCUETIME_WINDOW_TARGET_ROWS,
+            target_seconds=settings.RESCUETIME_WINDOW_TARGET_SECONDS)
+        print('processing from {} for member {}'.format(checkpoint['cursor'],
+                                                        oh_member.oh_id))
+        # windows finish in any order, the cursor only moves past windows
+        # that finished without a gap before them
+        finished = {}
+        with metrics.timed('fetch'):
+            for window, response_json in fetch_windows(
+                    rescuetime_access_token, planner):
+                if not checkpoint['header']:
+                    checkpoint['header'] = {
+                        k: v for k, v in response_json.items() if k != 'rows'}
+                checkpoint['rows'].extend(response_json['rows'])
+                metrics.inc('rescuetime_windows_total')
+                metrics.inc('rescuetime_rows_fetched_total',
+                            len(response_json['rows']))
+                finished[window[0]] = window[1]
+                while cursor in finished:
+                    cursor = finished.pop(cursor) + timedelta(days=1)
+                checkpoint['cursor'] = datetime.strftime(cursor, '%Y-%m-%d')
+                # an import of years of data can take longer than the lock
+                if lock is not None:
+                    extend_sync_lock(lock)
     except:
-        process_rescuetime.apply_async(args=[oh_member.oh_id], countdown=61)
-    finally:
-        replace_rescuetime(oh_member, rescuetime_data)
-
-
-def replace_rescuetime(oh_member, rescuetime_data):
-    # delete old file and upload new to open humans
-    tmp_directory = tempfile.mkdtemp()
-    metadata = {
-        'description':
-        'RescueTime productivity data.',
-        'tags': ['Rescuetime', 'productivity'],
-        'updated_at': str(datetime.utcnow()),
-        }
-    out_file = os.path.join(tmp_directory, 'rescuetime.json')
-    logger.debug('deleted old file for {}'.format(oh_member.oh_id))
-    api.delete_file(oh_member.access_token,
-                    oh_member.oh_id,
-                    file_basename="rescuetime.json")
-    with open(out_file, 'w') as json_file:
-        json.dump(rescuetime_data, json_file)
-        json_file.flush()
-    api.upload_aws(out_file, metadata,
-                   oh_member.access_token,
-                   project_member_id=oh_member.oh_id)
+        # keep what we got so far, the retry resumes at the cursor
+        if checkpoint is not None:
+            save_checkpoint(oh_member.oh_id, checkpoint)
+        # an interrupted import of the whole history continues in the
+        # background, without holding up the interactive queue
+        enqueue_rescuetime(
+            oh_member.oh_id, countdown=61, retry=True,
+            queue=update_queue(oh_member.datasourcemember.last_uploaded))
+        metrics.inc('rescuetime_updates_total', result='retried')
+        return
+    digest, uploaded = replace_rescuetime(oh_member, existing,
+                                          checkpoint['header'],
+                                          checkpoint['rows'])
+    clear_checkpoint(oh_member.oh_id)
+    metrics.inc('rescuetime_updates_total',
+                result='uploaded' if uploaded else 'unchanged')
+    print('successfully finished update for {}'.format(oh_member.oh_id))
+    rescuetime_member = oh_member.datasourcemember
+    rescuetime_member.last_updated = arrow.now().format()
+    rescuetime_member.next_due_at = arrow.now().shift(
+        days=settings.RESCUETIME_UPDATE_INTERVAL).format()
+    rescuetime_member.data_digest = digest
+    if uploaded:
+        rescuetime_member.last_uploaded = arrow.now().format()
+    rescuetime_member.save()
+
+
+def fetch_window(rescuetime_access_token, window):
+    """
+    Request a single window from RescueTime, waiting for the
+    "rescuetime" realm to have capacity left. Returns the response data
+    and the seconds the request itself took.
+    """
+    query = build_query(RESCUETIME_API, rescuetime_access_token,
+                        datetime.strftime(window[0], "%Y-%m-%d"),
+                        datetime.strftime(window[1], "%Y-%m-%d"))
+    response = rr.get(query, wait=True, realms=['rescuetime'])
+    return response.json(), response.elapsed.total_seconds()
+
+
+def build_query(api_url, rescuetime_access_token, restrict_begin,
+                restrict_end):
+    return api_url + \
+        'access_token={}&restrict_begin={}&restrict_end={}'.format(
+          rescuetime_access_token,
+          restrict_begin,
+          restrict_end,
+        )
+
+
+def fetch_windows(rescuetime_access_token, planner):
+    """
+    Fetch the windows of the planner concurrently and yield
+    (window, response) pairs as they finish. Each finished window is
+    reported back to the planner, which sizes the following windows.
+    If a window fails, the windows that haven't been started yet are
+    cancelled.
+    """
+    fetch = partial(fetch_window, rescuetime_access_token)
+    workers = settings.RESCUETIME_FETCH_WORKERS
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            while True:
+                while len(pending) < workers:
+                    window = planner.next_window()
+                    if window is None:
+                        break
+                    pending[executor.submit(fetch, window)] = window
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    window = pending.pop(future)
+                    response_json, seconds = future.result()
+                    planner.observe(window, len(response_json['rows']),
+                                    seconds)
+                    yield window, response_json
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def replace_rescuetime(oh_member, existing, header, new_rows):
+    """
+    Merge the new rows into the existing data and update the files on
+    Open Humans. In the "delta" storage mode only the new rows are
+    uploaded as a delta file, until there are too many deltas and they are
+    compacted into a new base file. If nothing changed, nothing is
+    uploaded. Returns the sha256 digest of the newest file and whether
+    something was uploaded.
+
+    New files are uploaded before the files they replace are deleted, so
+    a failed upload never leaves a member without data.
+    """
+    with tempfile.TemporaryDirectory() as tmp_directory:
+        out_file = os.path.join(tmp_directory, 'rescuetime.json')
+        column = key_column(header)
+        with metrics.timed('write'), \
+                open(out_file, 'w', newline='') as json_file:
+            if existing['file'] is None:
+                index = write_rescuetime(
+                    json_file, header,
+                    (row for _, row in new_rows.iter_unique(column)))
+            else:
+                with open(existing['file'], newline='') as existing_file:
+                    index = write_merged_rescuetime(
+                        json_file, existing_file, existing['index'],
+                        new_rows.iter_unique(column), column)
+        if (settings.RESCUETIME_STORAGE_MODE == 'delta' and
+                existing['data_file'] is not None and
+                existing['data_file']['metadata'].get('sha256')):
+            newest = newest_file(existing['data_file'], existing['deltas'])
+            if (cache.file_digest(out_file) ==
+                    cache.file_digest(existing['file'])):
+                logger.debug('data of {} is unchanged, skipping upload'.format(
+                    oh_member.oh_id))
+                return newest['metadata']['sha256'], False
+            digest = upload_delta(oh_member, existing, header, new_rows,
+                                  column)
+            if digest is not None:
+                # the local copy holds the base with all deltas applied
+                cache.add_file(oh_member.oh_id, digest, out_file, index)
+                return digest, True
+            logger.debug('compacting deltas of {}'.format(oh_member.oh_id))
+        digest = upload_base(oh_member, existing, out_file)
+        if digest is None:
+            logger.debug('data of {} is unchanged, skipping upload'.format(
+                oh_member.oh_id))
+            return existing['data_file']['metadata']['sha256'], False
+        cache.add_file(oh_member.oh_id, digest, out_file, index)
+        return digest, True
+
+
+def encoded(output_format, source_path):
+    """
+    Return a spooled temporary file (in memory unless it is large) with
+    the rescuetime.json at source_path encoded into output_format.
+    """
+    payload = tempfile.SpooledTemporaryFile(
+        max_size=settings.RESCUETIME_SPOOL_MAX_BYTES)
+    with metrics.timed('encode'):
+        formats.encode(output_format, source_path, payload)
+    payload.seek(0)
+    return payload
+
+
+def upload(oh_member, payload, filename, metadata):
+    size = cache.stream_size(payload)
+    if size <= settings.RESCUETIME_SPOOL_MAX_BYTES:
+        # requests asks a file object with fileno() for its size, which
+        # would write the spooled file to disk. It is still in memory, pass
+        # it on from there.
+        payload = io.BytesIO(payload.read())
+    with metrics.timed('upload'):
+        api.upload_stream(payload, filename, metadata,
+                          oh_member.access_token,
+                          project_member_id=oh_member.oh_id)
+    metrics.inc('rescuetime_bytes_uploaded_total', size,
+                role=metadata['role'])
+
+
+def upload_base(oh_member, existing, out_file):
+    """
+    Upload the merged file as the new base file and delete all files it
+    replaces afterwards. Returns its digest, or None if it is the same as
+    the existing base file and wasn't uploaded.
+    """
+    output_format = settings.RESCUETIME_OUTPUT_FORMAT
+    with encoded(output_format, out_file) as payload:
+        digest = cache.stream_digest(payload)
+        if (existing['data_file'] is not None and
+                existing['data_file']['metadata'].get('sha256') == digest):
+            return None
+        metadata = {
+            'description':
+            'RescueTime productivity data.',
+            'tags': ['Rescuetime', 'productivity'],
+            'updated_at': str(datetime.utcnow()),
+            'format': output_format,
+            'format_description': formats.DESCRIPTIONS[output_format],
+            'role': 'base',
+            'sha256': digest,
+            }
+        upload(oh_member, payload, formats.filename(output_format), metadata)
     logger.debug('uploaded new file for {}'.format(oh_member.oh_id))
+    # only now delete the old files (including deltas)
+    for dfile in existing['data_files']:
+        api.delete_file(oh_member.access_token,
+                        oh_member.oh_id,
+                        file_id=dfile['id'])
+    logger.debug('deleted old files for {}'.format(oh_member.oh_id))
+    return digest
+
+
+def upload_delta(oh_member, existing, header, new_rows, column):
+    """
+    Upload the new rows as a delta file of the existing base file. Returns
+    its digest, or None if the deltas need to be compacted instead.
+    """
+    output_format = settings.RESCUETIME_OUTPUT_FORMAT
+    with tempfile.TemporaryDirectory() as tmp_directory:
+        delta_file = os.path.join(tmp_directory, 'delta.json')
+        with open(delta_file, 'w', newline='') as json_file:
+            write_rescuetime(
+                json_file, header,
+                (row for _, row in new_rows.iter_unique(column)))
+        with encoded(output_format, delta_file) as payload:
+            size = cache.stream_size(payload)
+            deltas_size = sum(delta['metadata'].get('size', 0)
+                              for delta in existing['deltas'])
+            if (len(existing['deltas']) >=
+                    settings.RESCUETIME_DELTA_MAX_FILES or
+                    deltas_size + size > settings.RESCUETIME_DELTA_MAX_BYTES):
+                return None
+            digest = cache.stream_digest(payload)
+            metadata = {
+                'description':
+                'RescueTime productivity data, rows added to the base file.',
+                'tags': ['Rescuetime', 'productivity', 'delta'],
+                'updated_at': str(datetime.utcnow()),
+                'format': output_format,
+                'format_description': formats.DESCRIPTIONS[output_format],
+                'role': 'delta',
+                'base': existing['data_file']['metadata']['sha256'],
+                'size': size,
+                'sha256': digest,
+                }
+            filename = formats.filename(
+                output_format, name='rescuetime-delta-{}'.format(
+                    datetime.utcnow().strftime('%Y%m%dT%H%M%S')))
+            upload(oh_member, payload, filename, metadata)
+    logger.debug('uploaded delta file for {}'.format(oh_member.oh_id))
+    return digest
 
 
-def remove_partial_data(rescuetime_data, start_date):
-    if rescuetime_data != {}:
-        for i, element in enumerate(rescuetime_data['rows']):
-            if element[0][:10] == start_date:
-                final_element = i
-        rescuetime_data['rows'] = rescuetime_data['rows'][:final_element]
-        return rescuetime_data
-    return {}
-
-
-def get_start_date(rescuetime_data, rescuetime_access_token):
-    if rescuetime_data == {}:
-        return "2008-01-01"
-        # url = MOVES_API_BASE + "/user/profile?access_token={}".format(
-        #                                 rescuetime_access_token
-        # )
-        # response = rr.get(url, wait=True, realms=['moves'])
-        # return response.json()['profile']['firstDate']
+def get_start_date(existing_index, rescuetime_access_token):
+    if existing_index is None:
+        try:
+            return get_first_date(rescuetime_access_token)
+        except:
+            logger.debug('could not find first date, using {}'.format(
+                RESCUETIME_EPOCH))
+            return RESCUETIME_EPOCH
     else:
-        return rescuetime_data['rows'][-1][0][:10]
+        return format_timestamp(existing_index['days'][-1][0])[:10]
+
+
+def get_first_date(rescuetime_access_token):
+    """
+    Find the first month for which a member has data, using a single
+    coarse query over everything since RESCUETIME_EPOCH. Members without
+    any data start today. Raises if RescueTime didn't answer with rows,
+    e.g. for errors or rate limits.
+    """
+    today = datetime.strftime(datetime.utcnow(), "%Y-%m-%d")
+    query = build_query(RESCUETIME_PROBE_API, rescuetime_access_token,
+                        RESCUETIME_EPOCH, today)
+    response = rr.get(query, wait=True, realms=['rescuetime'])
+    response.raise_for_status()
+    rows = response.json()['rows']
+    if not rows:
+        return today
+    return min(row[0] for row in rows)[:10]
+
+
+def is_delta(dfile):
+    return dfile['metadata'].get('role') == 'delta'
+
+
+def rescuetime_data_files(data_files):
+    return [dfile for dfile in data_files
+            if 'Rescuetime' in dfile['metadata']['tags']]
+
+
+def rescuetime_versions(rescuetime_files):
+    """
+    Return the base files among the rescuetime files of a member, each
+    with its deltas (oldest first), the newest base file first. Older base
+    files are only used if the newer ones are empty.
+    """
+    versions = []
+    bases = [dfile for dfile in rescuetime_files if not is_delta(dfile)]
+    for base in sorted(bases, key=lambda dfile: dfile['created'],
+                       reverse=True):
+        base_digest = base['metadata'].get('sha256')
+        deltas = sorted([dfile for dfile in rescuetime_files
+                         if is_delta(dfile) and base_digest and
+                         dfile['metadata'].get('base') == base_digest],
+                        key=lambda dfile: dfile['created'])
+        versions.append((base, deltas))
+    return versions
+
+
+def newest_file(base, deltas):
+    """
+    Return the newest file of a version, whose digest stands for the data
+    of the base file with all deltas applied.
+    """
+    return (deltas or [base])[-1]
 
 
 def get_existing_rescuetime(oh_access_token):
+    """
+    Find the newest rescuetime base file of a member with data. Returns a
+    dict with the OH base file, its deltas, the path of the local (plain
+    json) copy with all deltas applied and its index, and all rescuetime
+    data files on OH. For members without data file, path and index are
+    None.
+    """
     member = api.exchange_oauth2_member(oh_access_token)
-    for dfile in member['data']:
-        if 'Rescuetime' in dfile['metadata']['tags']:
-            # get file here and read the json into memory
-            tf_in = tempfile.NamedTemporaryFile(suffix='.json')
-            tf_in.write(requests.get(dfile['download_url']).content)
-            tf_in.flush()
-            rescuetime_data = json.load(open(tf_in.name))
-            if 'rows' in rescuetime_data.keys():
-                if len(rescuetime_data['rows']) > 0:
-                    return rescuetime_data
-    return {}
+    oh_id = member['project_member_id']
+    rescuetime_files = rescuetime_data_files(member['data'])
+    existing = {'file': None, 'index': None, 'data_file': None,
+                'deltas': [], 'data_files': rescuetime_files}
+    for base, deltas in rescuetime_versions(rescuetime_files):
+        # the local copy is stored under the key of the newest file
+        key = cache.cache_key(newest_file(base, deltas))
+        path = cache.get_cached_file(oh_id, key)
+        if path is None:
+            logger.debug('cache miss for {}, downloading'.format(oh_id))
+            path = download_rescuetime(oh_id, key, base, deltas)
+        index = cache.load_index(path)
+        if index is not None and index['days']:
+            existing.update({'file': path, 'index': index,
+                             'data_file': base, 'deltas': deltas})
+            break
+    return existing
+
+
+def download_rescuetime(oh_id, key, base, deltas):
+    """
+    Download a base file, apply its deltas and add the result to the cache
+    under key. Until all deltas are applied nothing is cached, so the key
+    never points at an incomplete file.
+    """
+    with tempfile.TemporaryDirectory() as tmp_directory:
+        path = os.path.join(tmp_directory, 'rescuetime.json')
+        with open(path, 'wb') as f:
+            cache.download(base['download_url'], formats.file_format(base),
+                           f)
+        index = None
+        for number, delta in enumerate(deltas):
+            path, index = apply_delta(tmp_directory, number, path, index,
+                                      delta)
+        return cache.add_file(oh_id, key, path, index)
+
+
+def apply_delta(directory, number, path, index, delta):
+    """
+    Download a delta file and merge its rows into the file at path. Writes
+    the merged file into directory and returns its path and index.
+    """
+    delta_file = os.path.join(directory, 'delta.json')
+    with open(delta_file, 'wb') as f:
+        cache.download(delta['download_url'], formats.file_format(delta), f)
+    with open(delta_file, newline='') as f:
+        header, rows = read_rescuetime(f)
+        delta_rows = RowStore()
+        delta_rows.extend(rows)
+    os.remove(delta_file)
+    if index is None:
+        with open(path, newline='') as f:
+            index = build_index(f)
+    column = key_column(header)
+    out_file = os.path.join(directory, 'rescuetime-{}.json'.format(number))
+    with open(out_file, 'w', newline='') as json_file, \
+            open(path, newline='') as existing_file:
+        index = write_merged_rescuetime(
+            json_file, existing_file, index,
+            delta_rows.iter_unique(column), column)
+    os.remove(path)
+    return out_file, index
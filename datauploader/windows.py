@@ -0,0 +1,55 @@
+"""
+Planning of the date windows that are requested from RescueTime.
+
+Windows are inclusive (begin, end) date ranges. Their size adapts to the
+row density that was observed in earlier windows: periods without data
+are skipped with wide windows, busy periods are split into narrow ones so
+that a single response stays below the row and latency targets.
+"""
+from datetime import timedelta
+
+# size of the first window, before anything has been observed
+INITIAL_DAYS = 14
+# never grow or shrink a window by more than this factor at once
+MAX_STEP = 4
+
+
+class WindowPlanner(object):
+
+    def __init__(self, start_date, stop_date, target_rows=20000,
+                 target_seconds=10, min_days=1, max_days=180):
+        self.cursor = start_date
+        self.stop_date = stop_date
+        self.target_rows = target_rows
+        self.target_seconds = target_seconds
+        self.min_days = min_days
+        self.max_days = max_days
+        self.days = min(max(INITIAL_DAYS, min_days), max_days)
+
+    def next_window(self):
+        """
+        Return the next (begin, end) window or None if the planner reached
+        the stop date.
+        """
+        if self.cursor >= self.stop_date:
+            return None
+        begin = self.cursor
+        end = min(begin + timedelta(days=self.days - 1), self.stop_date)
+        self.cursor = end + timedelta(days=1)
+        return begin, end
+
+    def observe(self, window, rows, seconds):
+        """
+        Resize the next windows after a window with the given number of
+        rows took the given number of seconds to fetch.
+        """
+        days = (window[1] - window[0]).days + 1
+        if rows == 0:
+            factor = MAX_STEP
+        else:
+            factor = self.target_rows / rows
+            if seconds > 0:
+                factor = min(factor, self.target_seconds / seconds)
+        factor = min(max(factor, 1.0 / MAX_STEP), MAX_STEP)
+        self.days = int(min(max(days * factor, self.min_days),
+                            self.max_days))
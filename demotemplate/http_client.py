@@ -0,0 +1,61 @@
+"""
+Pooled HTTP sessions for all outbound requests of this app.
+
+Every process (web or Celery worker) gets its own requests.Session, which
+keeps connections to RescueTime and Open Humans alive between calls.
+All requests get a default (connect, read) timeout and are retried on
+connection errors and 5xx responses from the server.
+"""
+import os
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+
+
+class TimeoutSession(requests.Session):
+    """
+    A requests.Session that applies a default timeout to every request.
+    """
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def make_session():
+    session = TimeoutSession(timeout=(settings.HTTP_CONNECT_TIMEOUT,
+                                      settings.HTTP_READ_TIMEOUT))
+    retries = Retry(total=settings.HTTP_MAX_RETRIES,
+                    backoff_factor=0.5,
+                    status_forcelist=[500, 502, 503, 504])
+    # the pool has to be large enough for all fetch threads of a task
+    adapter = HTTPAdapter(
+        pool_maxsize=max(10, settings.RESCUETIME_FETCH_WORKERS),
+        max_retries=retries)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """
+    Return the session of the current process. Celery forks its workers
+    after importing the tasks, so a session is never shared across a fork.
+    """
+    global _session, _session_pid
+    with _lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = make_session()
+            _session_pid = os.getpid()
+        return _session
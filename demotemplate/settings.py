@@ -11,10 +11,12 @@ https://docs.djangoproject.com/en/2.0/ref/settings/
 """
 
 import os
+import tempfile
 import dj_database_url
 from env_tools import apply_env
 from env_tools import env_to_bool, get_enforcement_context
 from requests_respectful import RespectfulRequester
+from demotemplate.http_client import get_session
 
 apply_env()
 
@@ -66,6 +68,48 @@ OH_DELETE_FILES = OH_API_BASE + '/project/files/delete/'
 RESCUETIME_CLIENT_ID = os.getenv('RESCUETIME_CLIENT_ID')
 RESCUETIME_CLIENT_SECRET = os.getenv('RESCUETIME_CLIENT_SECRET')
 RESCUETIME_REDIRECT_URI = os.getenv('RESCUETIME_REDIRECT_URI')
+# Number of RescueTime windows fetched in parallel for a single member.
+RESCUETIME_FETCH_WORKERS = int(os.getenv('RESCUETIME_FETCH_WORKERS', 4))
+# Windows are resized so that a single response stays below these targets.
+RESCUETIME_WINDOW_TARGET_ROWS = int(
+    os.getenv('RESCUETIME_WINDOW_TARGET_ROWS', 20000))
+RESCUETIME_WINDOW_TARGET_SECONDS = float(
+    os.getenv('RESCUETIME_WINDOW_TARGET_SECONDS', 10))
+# Format of the uploaded file: json, json.gz, ndjson.gz or csv.gz
+# see datauploader/formats.py
+RESCUETIME_OUTPUT_FORMAT = os.getenv('RESCUETIME_OUTPUT_FORMAT', 'json')
+# "full" uploads the whole file on every update, "delta" only uploads the
+# new rows as delta files until there are too many of them
+RESCUETIME_STORAGE_MODE = os.getenv('RESCUETIME_STORAGE_MODE', 'full')
+RESCUETIME_DELTA_MAX_FILES = int(os.getenv('RESCUETIME_DELTA_MAX_FILES', 30))
+RESCUETIME_DELTA_MAX_BYTES = int(
+    os.getenv('RESCUETIME_DELTA_MAX_BYTES', 20 * 1024 * 1024))
+# Files to upload are kept in memory up to this size, larger ones spill to disk
+RESCUETIME_SPOOL_MAX_BYTES = int(
+    os.getenv('RESCUETIME_SPOOL_MAX_BYTES', 16 * 1024 * 1024))
+# Members are updated every RESCUETIME_UPDATE_INTERVAL days by the
+# update_data command, which enqueues RESCUETIME_UPDATE_CHUNK_SIZE tasks at a
+# time and spreads them over RESCUETIME_UPDATE_SPREAD seconds
+RESCUETIME_UPDATE_INTERVAL = float(os.getenv('RESCUETIME_UPDATE_INTERVAL', 4))
+RESCUETIME_UPDATE_CHUNK_SIZE = int(
+    os.getenv('RESCUETIME_UPDATE_CHUNK_SIZE', 500))
+RESCUETIME_UPDATE_SPREAD = int(os.getenv('RESCUETIME_UPDATE_SPREAD', 3600))
+# Local cache of the files we uploaded, see datauploader/cache.py
+RESCUETIME_CACHE_DIR = os.getenv(
+    'RESCUETIME_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), 'rescuetime-cache'))
+RESCUETIME_CACHE_MAX_BYTES = int(
+    os.getenv('RESCUETIME_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+# Bearer token required to read /metrics, which is open if it isn't set
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Outbound HTTP: timeouts (in seconds) and retries on connection errors
+# and server errors, see demotemplate/http_client.py
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 60))
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 3))
 
 # Requests Respectful (rate limiting, waiting)
 if REMOTE is True:
@@ -80,8 +124,15 @@ if REMOTE is True:
         },
         safety_threshold=5)
 
+# Where the rate limits are kept: "redis" shares them between all processes,
+# "memory" keeps them in the process (for single-process setups and tests)
+RespectfulRequester.configure(
+    backend=os.getenv('RATE_LIMIT_BACKEND', 'redis'))
+# Rate-limited requests that wait are served in the order they started waiting
+RATE_LIMIT_FAIR = os.getenv('RATE_LIMIT_FAIR', 'false').lower() == 'true'
+
 # This creates a Realm called "source" that allows 60 requests per minute maximum.
-rr = RespectfulRequester()
+rr = RespectfulRequester(session=get_session, fair=RATE_LIMIT_FAIR)
 rr.register_realm("rescuetime", max_requests=60, timespan=60)
 
 # Applications installed
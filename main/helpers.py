@@ -1,22 +1,44 @@
 from ohapi import api
 from django.conf import settings
+from datauploader.tasks import (rescuetime_data_files, rescuetime_versions,
+                                newest_file)
 import arrow
 from datetime import timedelta
 
 
 def get_rescuetime_file(oh_member):
+    """
+    Return the download url of the rescuetime base file the last update
+    used (the newest one if unknown) and the urls of its delta files,
+    oldest first. The rows of the deltas are added to (or replace) the
+    rows of the base file in that order.
+    """
     try:
-        oh_access_token = oh_member.get_access_token(
-                            client_id=settings.OPENHUMANS_CLIENT_ID,
-                            client_secret=settings.OPENHUMANS_CLIENT_SECRET)
-        user_object = api.exchange_oauth2_member(oh_access_token)
-        for dfile in user_object['data']:
-            if 'Rescuetime' in dfile['metadata']['tags']:
-                return dfile['download_url']
-        return ''
+        versions = rescuetime_versions(get_rescuetime_data_files(oh_member))
+        if not versions:
+            return '', []
+        # the update records the digest of the version it found data in
+        data_digest = oh_member.datasourcemember.data_digest
+        base, deltas = next(
+            (version for version in versions
+             if newest_file(*version)['metadata'].get('sha256') ==
+             data_digest), versions[0])
+        return (base['download_url'],
+                [delta['download_url'] for delta in deltas])
 
     except:
-        return 'error'
+        return 'error', []
+
+
+def get_rescuetime_data_files(oh_member):
+    """
+    Return all rescuetime files of a member on Open Humans.
+    """
+    oh_access_token = oh_member.get_access_token(
+                            client_id=settings.OPENHUMANS_CLIENT_ID,
+                            client_secret=settings.OPENHUMANS_CLIENT_SECRET)
+    user_object = api.exchange_oauth2_member(oh_access_token)
+    return rescuetime_data_files(user_object['data'])
 
 
 def check_update(rescuetime_member):
@@ -1,18 +1,57 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db.models import Q
 from main.models import DataSourceMember
-from datauploader.tasks import process_rescuetime
+from datauploader.helpers import claim_queued
+from datauploader.tasks import process_rescuetime, update_queue
+from celery import group
 import arrow
-from datetime import timedelta
+import random
+import time
 
 
 class Command(BaseCommand):
     help = 'Updates data for all members'
 
     def handle(self, *args, **options):
-        users = DataSourceMember.objects.all()
-        for rescuetime_user in users:
-            if rescuetime_user.last_updated < (arrow.now() - timedelta(days=4)):
-                oh_id = rescuetime_user.user.oh_id
-                process_rescuetime.delay(oh_id)
-            else:
-                print("didn't update {}".format(rescuetime_user.user.oh_id))
+        now = arrow.now()
+        due = (DataSourceMember.objects
+               .filter(Q(next_due_at__isnull=True) |
+                       Q(next_due_at__lte=now.datetime))
+               .values_list('pk', 'user__oh_id', 'last_uploaded')
+               .iterator(chunk_size=settings.RESCUETIME_UPDATE_CHUNK_SIZE))
+        chunk = []
+        queued = 0
+        for member in due:
+            chunk.append(member)
+            if len(chunk) == settings.RESCUETIME_UPDATE_CHUNK_SIZE:
+                queued += self.enqueue(chunk, now)
+                chunk = []
+        if chunk:
+            queued += self.enqueue(chunk, now)
+        print('queued updates for {} members'.format(queued))
+
+    def enqueue(self, members, now):
+        """
+        Queue the updates of a chunk of members at once, spread out over
+        RESCUETIME_UPDATE_SPREAD seconds, and move them out of the due ones
+        so the next run doesn't queue them again. Members with an update
+        that is queued or running already are skipped. Members without
+        any data yet need all of it imported, which goes to the backfill
+        queue.
+        """
+        tasks = []
+        for _, oh_id, last_uploaded in members:
+            countdown = random.uniform(0, settings.RESCUETIME_UPDATE_SPREAD)
+            queue = update_queue(last_uploaded)
+            if claim_queued(oh_id, countdown, queue=queue):
+                tasks.append(process_rescuetime.signature(
+                    args=[oh_id], kwargs={'due_at': time.time() + countdown},
+                    countdown=countdown, queue=queue))
+        if tasks:
+            group(tasks).apply_async()
+        DataSourceMember.objects.filter(
+            pk__in=[member[0] for member in members]).update(
+                next_due_at=now.shift(
+                    days=settings.RESCUETIME_UPDATE_INTERVAL).datetime)
+        return len(tasks)
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def set_next_due_at(apps, schema_editor):
+    DataSourceMember = apps.get_model('main', 'DataSourceMember')
+    DataSourceMember.objects.update(
+        next_due_at=F('last_updated') + timedelta(
+            days=settings.RESCUETIME_UPDATE_INTERVAL))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_datasourcemember_data_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasourcemember',
+            name='next_due_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(set_next_due_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+from django.db.models import F
+
+
+def set_last_uploaded(apps, schema_editor):
+    # members from before last_uploaded existed have been updated (and had
+    # their data uploaded) already, so their updates aren't backfills
+    DataSourceMember = apps.get_model('main', 'DataSourceMember')
+    DataSourceMember.objects.filter(last_uploaded__isnull=True).update(
+        last_uploaded=F('last_updated'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_datasourcemember_next_due_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_last_uploaded, migrations.RunPython.noop),
+    ]
@@ -22,3 +22,10 @@ class DataSourceMember(models.Model):
                             default=(arrow.now() - timedelta(days=7)).format())
     last_submitted = models.DateTimeField(
                             default=(arrow.now() - timedelta(days=7)).format())
+    # sha256 of the file on Open Humans and when it was last uploaded,
+    # updates that don't change the data don't upload it again
+    data_digest = models.CharField(max_length=64, default="", blank=True)
+    last_uploaded = models.DateTimeField(null=True, blank=True)
+    # when the update_data command should update this member next,
+    # members without one are due right away
+    next_due_at = models.DateTimeField(null=True, blank=True, db_index=True)
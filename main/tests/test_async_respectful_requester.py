@@ -0,0 +1,64 @@
+import asyncio
+import unittest
+import requests
+from django.test import TestCase
+from requests_respectful import (AsyncRespectfulRequester,
+                                 RequestsRespectfulError,
+                                 RequestsRespectfulRateLimitedError)
+from requests_respectful.globals import config
+from requests_respectful.async_respectful_requester import aioredis
+
+
+class FakeAsyncClient:
+
+    async def get(self, url, **kwargs):
+        return 'get', url, kwargs
+
+
+@unittest.skipIf(aioredis is None, 'the asyncio requester needs redis>=4.2')
+class AsyncRespectfulRequesterTestCase(TestCase):
+    """
+    test the asyncio requester against the Redis server of the tests
+    """
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.client = FakeAsyncClient()
+        self.rr = AsyncRespectfulRequester(session=lambda: self.client)
+        # two requests left after the safety threshold
+        self.complete(self.rr.register_realm(
+            'test-async', config['safety_threshold'] + 2, 60))
+
+    def tearDown(self):
+        self.complete(self.rr.unregister_realm('test-async'))
+        self.loop.close()
+
+    def complete(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_send(self):
+        for _ in range(2):
+            self.assertEqual(
+                self.complete(self.rr.send('GET', 'https://example.com',
+                                           params={'a': 1},
+                                           realms=['test-async'])),
+                ('get', 'https://example.com', {'params': {'a': 1}}))
+        with self.assertRaises(RequestsRespectfulRateLimitedError) as e:
+            self.complete(self.rr.send('GET', 'https://example.com',
+                                       realms=['test-async']))
+        self.assertTrue(0 < e.exception.wait <= 60)
+
+    def test_request_validation(self):
+        client = self.client
+        with self.assertRaises(RequestsRespectfulError):
+            self.complete(self.rr.request(
+                lambda: client.get('https://example.com'),
+                realms=['test-async']))
+        # only validated, never called
+        self.rr._validate_request_func(
+            lambda: requests.get('https://example.com'))
+
+    def test_unregistered_realm(self):
+        with self.assertRaises(RequestsRespectfulError):
+            self.complete(self.rr.send('GET', 'https://example.com',
+                                       realms=['test-async-unknown']))
@@ -0,0 +1,76 @@
+import os
+import tempfile
+from django.test import TestCase, override_settings
+from datauploader import cache
+
+
+class CacheTestCase(TestCase):
+    """
+    test storing and evicting cached rescuetime files
+    """
+
+    def setUp(self):
+        self.tmp_directory = tempfile.TemporaryDirectory()
+        self.source_directory = tempfile.TemporaryDirectory()
+        self.settings = override_settings(
+            RESCUETIME_CACHE_DIR=self.tmp_directory.name,
+            RESCUETIME_CACHE_MAX_BYTES=150)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.tmp_directory.cleanup()
+        self.source_directory.cleanup()
+
+    def add(self, oh_id, key, size, mtime=None):
+        source = os.path.join(self.source_directory.name, 'source')
+        with open(source, 'w') as f:
+            f.write('x' * size)
+        path = cache.add_file(oh_id, key, source, index={'days': []})
+        if mtime is not None:
+            for touched in (path, cache.index_path(path)):
+                os.utime(touched, (mtime, mtime))
+        return path
+
+    def test_store(self):
+        path = self.add(1, 'a', 50)
+        self.assertEqual(cache.get_cached_file(1, 'a'), path)
+        self.assertEqual(cache.load_index(path), {'days': []})
+        # only the latest file of a member is kept
+        path = self.add(1, 'b', 50)
+        self.assertIsNone(cache.get_cached_file(1, 'a'))
+        self.assertEqual(cache.get_cached_file(1, 'b'), path)
+
+    def test_store_never_evicts_the_new_file(self):
+        self.add(1, 'a', 50, mtime=1000)
+        # larger than the whole cache, the other member's file goes
+        path = self.add(2, 'b', 200)
+        self.assertEqual(cache.get_cached_file(2, 'b'), path)
+        self.assertTrue(os.path.exists(cache.index_path(path)))
+        self.assertIsNone(cache.get_cached_file(1, 'a'))
+
+    def test_evict(self):
+        first = self.add(1, 'a', 50, mtime=1000)
+        second = self.add(2, 'b', 50, mtime=2000)
+        # reading a file marks it and its index as recently used
+        self.assertEqual(cache.get_cached_file(1, 'a'), first)
+        cache.evict(max_bytes=80)
+        self.assertTrue(os.path.exists(first))
+        self.assertTrue(os.path.exists(cache.index_path(first)))
+        self.assertFalse(os.path.exists(second))
+        self.assertFalse(os.path.exists(cache.index_path(second)))
+
+    def test_evict_keep(self):
+        first = self.add(1, 'a', 50, mtime=1000)
+        self.add(2, 'b', 50, mtime=2000)
+        cache.evict(max_bytes=0, keep=first)
+        self.assertEqual(cache.get_cached_file(1, 'a'), first)
+        self.assertIsNone(cache.get_cached_file(2, 'b'))
+
+    def test_remove_member(self):
+        self.add(1, 'a', 50)
+        cache.remove_member(1)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tmp_directory.name, '1')))
+        # nothing cached is fine too
+        cache.remove_member(2)
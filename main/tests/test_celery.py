@@ -1,4 +1,6 @@
-from datauploader.tasks import process_rescuetime
+from datauploader.tasks import process_rescuetime, update_queue
+from datauploader.celery import (INTERACTIVE_QUEUE, SCHEDULED_QUEUE,
+                                 BACKFILL_QUEUE)
 from django.test import TestCase
 from freezegun import freeze_time
 from django.conf import settings
@@ -40,3 +42,16 @@ class CeleryTestCase(TestCase):
         #process_rescuetime(oh_member.oh_id)
         moves_member = oh_member.datasourcemember
         #self.assertEqual(moves_member.last_updated, arrow.get('2016-06-24'))
+
+    def test_update_queue(self):
+        moves_member = DataSourceMember.objects.get(user__oh_id=23456789)
+        # nothing uploaded yet, the whole history needs to be imported
+        self.assertEqual(update_queue(moves_member.last_uploaded),
+                         BACKFILL_QUEUE)
+        self.assertEqual(update_queue(moves_member.last_uploaded,
+                                      INTERACTIVE_QUEUE), BACKFILL_QUEUE)
+        moves_member.last_uploaded = arrow.get('2016-06-20').format()
+        self.assertEqual(update_queue(moves_member.last_uploaded),
+                         SCHEDULED_QUEUE)
+        self.assertEqual(update_queue(moves_member.last_uploaded,
+                                      INTERACTIVE_QUEUE), INTERACTIVE_QUEUE)
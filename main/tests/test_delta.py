@@ -0,0 +1,179 @@
+import io
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+from django.test import TestCase, override_settings
+from datauploader import cache, formats
+from datauploader.rows import RowStore
+from datauploader.streaming import read_rescuetime
+from datauploader.tasks import get_existing_rescuetime, replace_rescuetime
+
+HEADER = {'notes': 'data is an array of arrays',
+          'row_headers': ['Date', 'Time Spent (seconds)', 'Number of People',
+                          'Activity', 'Category', 'Productivity']}
+
+
+def rows(date, *activities):
+    return [['{}T10:0{}:00'.format(date, minute), 60, 1, activity, None, 0]
+            for minute, activity in enumerate(activities)]
+
+
+class FakeOpenHumans:
+    """
+    the data files of one member on Open Humans, for the api calls of the
+    tasks and the downloads of the cache
+    """
+
+    def __init__(self, oh_id):
+        self.oh_id = oh_id
+        self.files = []
+        self.uploads = 0
+
+    def exchange_oauth2_member(self, access_token):
+        return {'project_member_id': self.oh_id, 'data': list(self.files)}
+
+    def upload_stream(self, stream, filename, metadata, access_token,
+                      project_member_id):
+        self.uploads += 1
+        self.files.append({
+            'id': self.uploads,
+            'basename': filename,
+            'created': '2016-06-{:02}T00:00:00'.format(self.uploads),
+            'download_url': 'https://oh.example.com/{}'.format(self.uploads),
+            'metadata': metadata,
+            'content': stream.read(),
+        })
+
+    def delete_file(self, access_token, project_member_id, file_id):
+        self.files = [dfile for dfile in self.files
+                      if dfile['id'] != file_id]
+
+    def download(self, url, output_format, target):
+        dfile, = [dfile for dfile in self.files
+                  if dfile['download_url'] == url]
+        out = io.TextIOWrapper(target, encoding='utf-8', newline='')
+        formats.decode(output_format, io.BytesIO(dfile['content']), out)
+        out.flush()
+        out.detach()
+
+
+class DeltaTestCase(TestCase):
+    """
+    test uploading, applying and compacting delta files against a fake
+    Open Humans
+    """
+
+    def setUp(self):
+        self.tmp_directory = tempfile.TemporaryDirectory()
+        self.settings = override_settings(
+            RESCUETIME_CACHE_DIR=self.tmp_directory.name,
+            RESCUETIME_STORAGE_MODE='delta',
+            RESCUETIME_OUTPUT_FORMAT='json',
+            RESCUETIME_DELTA_MAX_FILES=2)
+        self.settings.enable()
+        self.oh = FakeOpenHumans('test-delta')
+        self.member = SimpleNamespace(oh_id='test-delta',
+                                      access_token='oh_access_token')
+        self.patches = [
+            mock.patch('datauploader.tasks.api', self.oh),
+            mock.patch('datauploader.cache.download', self.oh.download),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.settings.disable()
+        self.tmp_directory.cleanup()
+
+    def update(self, new_rows, cached=False):
+        if not cached:
+            # like a worker that didn't run the previous update
+            cache.remove_member(self.member.oh_id)
+        store = RowStore()
+        store.extend(new_rows)
+        existing = get_existing_rescuetime(self.member.access_token)
+        return existing, replace_rescuetime(self.member, existing, HEADER,
+                                            store)
+
+    def roles(self):
+        return [dfile['metadata']['role'] for dfile in self.oh.files]
+
+    def assertRows(self, path, expected):
+        with open(path, newline='') as f:
+            header, file_rows = read_rescuetime(f)
+            self.assertEqual(list(file_rows), expected)
+
+    def test_deltas(self):
+        first = rows('2016-06-01', 'a', 'b')
+        _, (digest, uploaded) = self.update(first)
+        self.assertTrue(uploaded)
+        self.assertEqual(self.roles(), ['base'])
+        base_digest = self.oh.files[0]['metadata']['sha256']
+        self.assertEqual(digest, base_digest)
+
+        second = rows('2016-06-02', 'a')
+        _, (digest, uploaded) = self.update(second)
+        self.assertEqual(self.roles(), ['base', 'delta'])
+        delta = self.oh.files[1]['metadata']
+        self.assertEqual((delta['base'], delta['sha256']),
+                         (base_digest, digest))
+
+        cache.remove_member(self.member.oh_id)
+        existing = get_existing_rescuetime(self.member.access_token)
+        self.assertEqual(len(existing['deltas']), 1)
+        self.assertRows(existing['file'], first + second)
+
+        # the delta replaces a row and adds another
+        third = [['2016-06-02T10:00:00', 30, 1, 'a', None, 0],
+                 ['2016-06-02T10:01:00', 60, 1, 'c', None, 0]]
+        _, (digest, uploaded) = self.update(third)
+        self.assertEqual(self.roles(), ['base', 'delta', 'delta'])
+        self.assertRows(cache.get_cached_file(self.member.oh_id, digest),
+                        first + third)
+
+        # unchanged data isn't uploaded
+        existing, (digest, uploaded) = self.update(third)
+        self.assertFalse(uploaded)
+        self.assertEqual(len(existing['deltas']), 2)
+        self.assertEqual(digest, self.oh.files[-1]['metadata']['sha256'])
+        self.assertRows(existing['file'], first + third)
+        self.assertEqual(self.oh.uploads, 3)
+
+    def test_compaction(self):
+        self.update(rows('2016-06-01', 'a'))
+        self.update(rows('2016-06-02', 'a'), cached=True)
+        self.update(rows('2016-06-03', 'a'), cached=True)
+        self.assertEqual(self.roles(), ['base', 'delta', 'delta'])
+        existing, (digest, uploaded) = self.update(rows('2016-06-04', 'a'))
+        # all deltas and the old base were replaced by a new base
+        self.assertTrue(uploaded)
+        self.assertEqual(self.roles(), ['base'])
+        self.assertEqual(self.oh.files[0]['id'], 4)
+        self.assertEqual(digest, self.oh.files[0]['metadata']['sha256'])
+        path = cache.get_cached_file(self.member.oh_id, digest)
+        self.assertRows(path, rows('2016-06-01', 'a') +
+                        rows('2016-06-02', 'a') + rows('2016-06-03', 'a') +
+                        rows('2016-06-04', 'a'))
+
+    def test_incomplete_download_is_not_cached(self):
+        self.update(rows('2016-06-01', 'a'))
+        self.update(rows('2016-06-02', 'a'), cached=True)
+        cache.remove_member(self.member.oh_id)
+        delta_url = self.oh.files[1]['download_url']
+        download = self.oh.download
+
+        def fail_delta(url, output_format, target):
+            if url == delta_url:
+                raise IOError('connection reset')
+            download(url, output_format, target)
+
+        with mock.patch('datauploader.cache.download', fail_delta):
+            with self.assertRaises(IOError):
+                get_existing_rescuetime(self.member.access_token)
+        self.assertIsNone(cache.get_cached_file(
+            self.member.oh_id, self.oh.files[1]['metadata']['sha256']))
+        existing = get_existing_rescuetime(self.member.access_token)
+        self.assertRows(existing['file'], rows('2016-06-01', 'a') +
+                        rows('2016-06-02', 'a'))
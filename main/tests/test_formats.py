@@ -0,0 +1,37 @@
+import io
+import json
+import os
+import tempfile
+from django.test import TestCase
+from datauploader import formats
+from datauploader.streaming import write_rescuetime
+
+HEADER = {'notes': 'data is an array of arrays',
+          'row_headers': ['Date', 'Time Spent (seconds)', 'Number of People',
+                          'Activity', 'Category', 'Productivity']}
+ROWS = [
+    ["2016-06-01T10:05:00", 60, 1, "github.com", "Software Development", 2],
+    ["2016-06-01T10:06:00", 35, 1, "2048", None, -2],
+    ["2016-06-02T08:00:00", 12, 1, "", "a, \"quoted\"\nline", 0],
+    ["2016-06-02T09:00:00", 5, 1, "\\N", "\\J1", None],
+]
+
+
+class FormatsTestCase(TestCase):
+    """
+    test that every output format decodes to the data that was encoded
+    """
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp_directory:
+            source = os.path.join(tmp_directory, 'rescuetime.json')
+            with open(source, 'w', newline='') as f:
+                write_rescuetime(f, HEADER, ROWS)
+            for output_format in formats.EXTENSIONS:
+                encoded = io.BytesIO()
+                formats.encode(output_format, source, encoded)
+                encoded.seek(0)
+                decoded = io.StringIO(newline='')
+                formats.decode(output_format, encoded, decoded)
+                self.assertEqual(json.loads(decoded.getvalue()),
+                                 dict(HEADER, rows=ROWS), output_format)
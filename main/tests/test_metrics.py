@@ -0,0 +1,29 @@
+from django.test import TestCase
+from datauploader.metrics import format_metrics
+
+
+class MetricsTestCase(TestCase):
+
+    def test_format_metrics(self):
+        values = {
+            'rescuetime_rows_fetched_total': 1200.0,
+            'rescuetime_phase_seconds_sum{phase="fetch"}': 12.5,
+            'rescuetime_phase_seconds_count{phase="fetch"}': 1.0,
+            'rescuetime_phase_seconds_bucket{le="+Inf",phase="fetch"}': 1.0,
+            'rescuetime_phase_seconds_bucket{le="30",phase="fetch"}': 1.0,
+            'rescuetime_phase_seconds_bucket{le="5",phase="fetch"}': 0.0,
+        }
+        self.assertEqual(format_metrics(values).splitlines(), [
+            '# HELP rescuetime_phase_seconds '
+            'Time spent in each phase of an update.',
+            '# TYPE rescuetime_phase_seconds histogram',
+            'rescuetime_phase_seconds_bucket{le="5",phase="fetch"} 0',
+            'rescuetime_phase_seconds_bucket{le="30",phase="fetch"} 1',
+            'rescuetime_phase_seconds_bucket{le="+Inf",phase="fetch"} 1',
+            'rescuetime_phase_seconds_count{phase="fetch"} 1',
+            'rescuetime_phase_seconds_sum{phase="fetch"} 12.5',
+            '# HELP rescuetime_rows_fetched_total '
+            'Rows fetched from RescueTime.',
+            '# TYPE rescuetime_rows_fetched_total counter',
+            'rescuetime_rows_fetched_total 1200',
+        ])
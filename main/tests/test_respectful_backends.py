@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.test import TestCase
+from freezegun import freeze_time
+from redis import StrictRedis
+from requests_respectful.backends import MemoryBackend, RedisBackend
+from main.tests.test_respectful_requester import (BackendTestMixin,
+                                                  BackendTests)
+
+
+class RealmTests(BackendTestMixin):
+    """
+    tests of the realm registry, shared by all backends
+    """
+
+    def test_realms(self):
+        self.assertEqual(set(self.backend.registered_realms()) &
+                         {'test-a', 'test-b'}, {'test-a', 'test-b'})
+        self.assertEqual(self.backend.realm_limits('test-a'), (2, 10))
+        self.assertFalse(self.backend.register_realm('test-a', 5, 5))
+        self.backend.update_realm('test-a', 'max_requests', 4)
+        self.assertEqual(self.backend.realm_limits('test-a'), (4, 10))
+        self.assertIsNone(self.backend.realm_limits('test-unknown'))
+
+
+class MemoryBackendTestCase(RealmTests, BackendTests, TestCase):
+    """
+    test that the in-process backend behaves like the Redis backend
+    """
+
+    def create_backend(self):
+        return MemoryBackend()
+
+    def test_reads_the_time(self):
+        with freeze_time('2020-01-01 00:00:00'):
+            self.assertEqual(self.reserve('1', None), (0, []))
+            self.assertEqual(self.reserve('2', None), (0, []))
+            self.assertEqual(self.reserve('3', None), (10, [0]))
+
+
+class RedisBackendRealmsTestCase(RealmTests, TestCase):
+
+    def create_backend(self):
+        return RedisBackend(StrictRedis.from_url(settings.REDIS_URL),
+                            'RespectfulRequesterTest')
@@ -0,0 +1,35 @@
+from datetime import timedelta
+from django.test import TestCase
+from freezegun import freeze_time
+from requests_respectful import RespectfulRequester, RequestsRespectfulError
+from requests_respectful.backends import MemoryBackend
+from requests_respectful.globals import config
+
+
+class RealmCacheTestCase(TestCase):
+    """
+    test the process local cache of the realm configuration
+    """
+
+    def setUp(self):
+        self.rr = RespectfulRequester(backend=MemoryBackend())
+        self.rr.register_realm('test', 10, 60)
+
+    def test_realm_cache(self):
+        other = RespectfulRequester(backend=self.rr.backend)
+        with freeze_time('2020-01-01 00:00:00') as frozen:
+            self.assertEqual(self.rr.realm_limits('test')[1], 60)
+            other.update_realm('test', timespan=30)
+            # the change of another requester is only seen once the
+            # cache expired
+            self.assertEqual(self.rr.realm_limits('test')[1], 60)
+            self.assertEqual(other.realm_limits('test')[1], 30)
+            frozen.tick(timedelta(seconds=config['realm_cache_ttl'] + 1))
+            self.assertEqual(self.rr.realm_limits('test')[1], 30)
+            # a requester sees its own changes at once
+            self.assertIn('test', self.rr.fetch_registered_realms())
+            self.rr.unregister_realm('test')
+            with self.assertRaises(RequestsRespectfulError):
+                self.rr.send('GET', 'https://example.com', realms=['test'])
+            self.rr.register_realm('test', 100, 10)
+            self.assertEqual(self.rr.realm_limits('test'), (100, 10))
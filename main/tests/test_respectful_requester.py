@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.test import TestCase
+from redis import StrictRedis
+from requests_respectful.backends import RedisBackend
+
+
+class BackendTestMixin:
+    """
+    realms for the backend tests, which reserve at fixed times so the
+    waits are exact
+    """
+
+    def setUp(self):
+        self.backend = self.create_backend()
+        self.backend.register_realm('test-a', 2, 10)
+        self.backend.register_realm('test-b', 3, 10)
+
+    def tearDown(self):
+        self.backend.unregister_realm('test-a')
+        self.backend.unregister_realm('test-b')
+
+    def reserve(self, request_id, now, realms=('test-a',), in_line=False):
+        realms = list(realms)
+        limits = [self.backend.realm_limits(realm) for realm in realms]
+        return self.backend.reserve(realms, limits, request_id, in_line, now)
+
+
+class BackendTests(BackendTestMixin):
+    """
+    tests of reserving all realms of a request at once, shared by all
+    backends
+    """
+
+    def test_limit(self):
+        self.assertEqual(self.reserve('1', 100), (0, []))
+        self.assertEqual(self.reserve('2', 101), (0, []))
+        # until the first request left the timespan
+        self.assertEqual(self.reserve('3', 102), (8, [0]))
+        self.assertEqual(self.reserve('4', 109.5), (0.5, [0]))
+        self.assertEqual(self.reserve('5', 110), (0, []))
+        self.assertEqual(self.reserve('6', 110), (1, [0]))
+
+    def test_all_realms_or_none(self):
+        self.assertEqual(self.reserve('1', 100), (0, []))
+        self.assertEqual(self.reserve('2', 100), (0, []))
+        self.assertEqual(self.reserve('3', 104, ('test-b', 'test-a')),
+                         (6, [1]))
+        # the limited request wasn't reserved in test-b either
+        for request_id in ('4', '5', '6'):
+            self.assertEqual(self.reserve(request_id, 104, ('test-b',)),
+                             (0, []))
+        self.assertEqual(self.reserve('7', 104, ('test-b',)), (10, [0]))
+
+
+class RedisBackendTestCase(BackendTests, TestCase):
+    """
+    test the reservation script against the Redis server of the tests
+    """
+
+    def create_backend(self):
+        return RedisBackend(StrictRedis.from_url(settings.REDIS_URL),
+                            'RespectfulRequesterTest')
@@ -0,0 +1,56 @@
+import inspect
+from unittest import mock
+import requests
+from django.test import TestCase
+from requests_respectful import (RespectfulRequester,
+                                 RequestsRespectfulError,
+                                 RequestsRespectfulRateLimitedError)
+from requests_respectful.backends import MemoryBackend
+from requests_respectful.globals import config
+
+
+class FakeSession:
+
+    def get(self, url, **kwargs):
+        return 'get', url, kwargs
+
+
+class RespectfulRequesterTestCase(TestCase):
+    """
+    test sending structured requests and validating request lambdas
+    """
+
+    def setUp(self):
+        self.rr = RespectfulRequester(session=FakeSession,
+                                      backend=MemoryBackend())
+        # two requests left after the safety threshold
+        self.rr.register_realm('test', config['safety_threshold'] + 2, 60)
+
+    def test_send(self):
+        self.assertEqual(
+            self.rr.send('GET', 'https://example.com', params={'a': 1},
+                         realms=['test']),
+            ('get', 'https://example.com', {'params': {'a': 1}}))
+        self.assertEqual(self.rr.get('https://example.com', realms=['test']),
+                         ('get', 'https://example.com', {}))
+        with self.assertRaises(RequestsRespectfulRateLimitedError) as e:
+            self.rr.send('GET', 'https://example.com', realms=['test'])
+        self.assertTrue(0 < e.exception.wait <= 60)
+        with self.assertRaises(RequestsRespectfulError):
+            self.rr.send('BREW', 'https://example.com', realms=['test'])
+        with self.assertRaises(RequestsRespectfulError):
+            self.rr.send('GET', 'https://example.com', realms=[])
+
+    def test_validation_cache(self):
+        with mock.patch('requests_respectful.respectful_requester.inspect'
+                        '.getsource', side_effect=inspect.getsource) as source:
+            for url in ('https://example.com/1', 'https://example.com/2'):
+                self.rr._validate_request_func(lambda: requests.get(url))
+            self.assertEqual(source.call_count, 1)
+            session = FakeSession()
+            for _ in range(2):
+                with self.assertRaises(RequestsRespectfulError):
+                    self.rr._validate_request_func(
+                        lambda: session.get('https://example.com'))
+            # invalid lambdas are checked again every time
+            self.assertEqual(source.call_count, 3)
@@ -0,0 +1,77 @@
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.test import TestCase
+from freezegun import freeze_time
+from redis import StrictRedis
+from requests_respectful import RespectfulRequester
+from requests_respectful.backends import MemoryBackend, RedisBackend
+from requests_respectful.globals import config
+from main.tests.test_respectful_requester import BackendTestMixin
+
+
+class WaitingTests(BackendTestMixin):
+    """
+    tests of requests waiting in line, shared by all backends
+    """
+
+    def test_in_line(self):
+        self.assertEqual(self.reserve('1', 100), (0, []))
+        self.assertEqual(self.reserve('2', 105), (0, []))
+        # each waiter waits for one more request to leave the timespan
+        self.assertEqual(self.reserve('x', 106, in_line=True), (4, [0]))
+        self.assertEqual(self.reserve('y', 106, in_line=True), (9, [0]))
+        # the capacity of 110 belongs to the first in line
+        self.assertEqual(self.reserve('z', 110), (10, [0]))
+        self.assertEqual(self.reserve('y', 110, in_line=True), (5, [0]))
+        self.assertEqual(self.reserve('x', 110, in_line=True), (0, []))
+        self.assertEqual(self.reserve('y', 115, in_line=True), (0, []))
+
+    def test_gone_waiters_leave_the_line(self):
+        self.assertEqual(self.reserve('1', 100), (0, []))
+        self.assertEqual(self.reserve('2', 100), (0, []))
+        self.assertEqual(self.reserve('x', 101, in_line=True), (9, [0]))
+        # x wasn't seen for two timespans
+        self.assertEqual(self.reserve('3', 121), (0, []))
+        self.assertEqual(self.reserve('4', 121), (0, []))
+
+
+class MemoryBackendWaitingTestCase(WaitingTests, TestCase):
+
+    def create_backend(self):
+        return MemoryBackend()
+
+
+class RedisBackendWaitingTestCase(WaitingTests, TestCase):
+
+    def create_backend(self):
+        return RedisBackend(StrictRedis.from_url(settings.REDIS_URL),
+                            'RespectfulRequesterTest')
+
+
+class FakeSession:
+
+    def get(self, url, **kwargs):
+        return 'get', url, kwargs
+
+
+class WaitTestCase(TestCase):
+    """
+    test that a waiting request sleeps exactly until there is capacity
+    """
+
+    def test_wait(self):
+        rr = RespectfulRequester(session=FakeSession, backend=MemoryBackend())
+        # one request left after the safety threshold
+        rr.register_realm('test', config['safety_threshold'] + 1, 60)
+        with freeze_time('2020-01-01 00:00:00') as frozen:
+            rr.get('https://example.com', realms=['test'])
+            frozen.tick(timedelta(seconds=15))
+            with mock.patch(
+                    'requests_respectful.respectful_requester.time.sleep',
+                    side_effect=lambda seconds: frozen.tick(
+                        timedelta(seconds=seconds))) as sleep:
+                self.assertEqual(rr.get('https://example.com',
+                                        realms=['test'], wait=True),
+                                 ('get', 'https://example.com', {}))
+        sleep.assert_called_once_with(45)
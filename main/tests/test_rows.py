@@ -0,0 +1,81 @@
+from unittest import mock
+from django.test import TestCase
+from datauploader.rows import (RowStore, parse_timestamp, format_timestamp,
+                               row_key, merge_sorted)
+
+ROWS = [
+    ["2016-06-01T10:05:00", 60, 1, "github.com", "Software Development", 2],
+    ["2016-06-01T10:06:00", 35, 1, "twitter.com", "Social Networking", -2],
+    ["2016-06-02T08:00:00", 12, 1, "github.com", None, 2],
+]
+
+
+class RowStoreTestCase(TestCase):
+    """
+    test that rows survive the columnar storage unchanged
+    """
+
+    def test_timestamps(self):
+        timestamp = parse_timestamp("2016-06-01T10:05:00")
+        self.assertEqual(format_timestamp(timestamp), "2016-06-01T10:05:00")
+
+    def test_round_trip(self):
+        store = RowStore()
+        store.extend(ROWS)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(list(store), ROWS)
+        # activities are interned, not stored per row
+        self.assertEqual(store.values.count("github.com"), 1)
+
+    def test_mixed_column(self):
+        store = RowStore()
+        store.extend(ROWS)
+        store.append(["2016-06-02T08:01:00", None, 1, "a", "b", 0.5])
+        self.assertEqual(store.row(3), ["2016-06-02T08:01:00", None, 1,
+                                        "a", "b", 0.5])
+        self.assertEqual(list(store)[:3], ROWS)
+
+    def test_json(self):
+        store = RowStore()
+        store.extend(ROWS)
+        store.truncate(2)
+        copy = RowStore.from_json(store.to_json())
+        self.assertEqual(list(copy), ROWS[:2])
+        copy.append(ROWS[2])
+        self.assertEqual(list(copy), ROWS)
+
+    def test_iter_unique(self):
+        store = RowStore()
+        # out of order and overlapping, like windows from a retry
+        store.extend([ROWS[2], ROWS[0], ROWS[1]])
+        store.append(["2016-06-01T10:05:00", 30, 1, "github.com",
+                      "Software Development", 2])
+        rows = [row for _, row in store.iter_unique(3)]
+        self.assertEqual(rows, [store.row(3), ROWS[1], ROWS[2]])
+
+    def test_iter_unique_keys(self):
+        store = RowStore()
+        rows = [["2016-06-0{}T10:0{}:00".format(day, minute), seconds, 1,
+                 activity, None, 0]
+                for seconds in (10, 20)
+                for day in (3, 1, 2)
+                for minute in (5, 1)
+                for activity in ("b", "a", 7, 0.5)]
+        store.extend(rows)
+        expected = {}
+        for row in rows:
+            expected[row_key(row, 3)] = row
+        # small chunks, so the sorted runs are merged
+        with mock.patch('datauploader.rows.SORT_CHUNK_SIZE', 5):
+            self.assertEqual(list(store.iter_unique(3)),
+                             sorted(expected.items()))
+            self.assertEqual(list(store.iter_unique(1)),
+                             sorted({row_key(row, 1): row
+                                     for row in rows}.items()))
+
+    def test_merge_sorted(self):
+        old = [(row_key(row, 3), row) for row in ROWS]
+        new_row = ["2016-06-01T10:06:00", 50, 1, "twitter.com",
+                   "Social Networking", -2]
+        rows = list(merge_sorted(old, [(row_key(new_row, 3), new_row)]))
+        self.assertEqual(rows, [ROWS[0], new_row, ROWS[2]])
@@ -0,0 +1,62 @@
+import io
+import json
+from django.test import TestCase
+from datauploader.rows import parse_timestamp, row_key
+from datauploader.streaming import (read_rescuetime, write_rescuetime,
+                                    write_merged_rescuetime, build_index,
+                                    trim_index)
+
+HEADER = {'notes': 'data is an array of arrays',
+          'row_headers': ['Date', 'Time Spent (seconds)', 'Activity']}
+ROWS = [
+    ["2016-06-01T10:05:00", 60, "github.com"],
+    ["2016-06-01T10:06:00", 35, "twitter.com"],
+    ["2016-06-03T08:00:00", 12, "github.com"],
+]
+
+
+def day(date):
+    return parse_timestamp(date + 'T00:00:00')
+
+
+class StreamingTestCase(TestCase):
+    """
+    test reading, writing and cutting rescuetime files
+    """
+
+    def setUp(self):
+        self.out = io.StringIO(newline='')
+        self.index = write_rescuetime(self.out, HEADER, ROWS)
+        self.data = self.out.getvalue()
+
+    def test_round_trip(self):
+        self.assertEqual(json.loads(self.data), dict(HEADER, rows=ROWS))
+        header, rows = read_rescuetime(io.StringIO(self.data))
+        self.assertEqual(list(rows), ROWS)
+        self.assertEqual(header, HEADER)
+
+    def test_index(self):
+        self.assertEqual(build_index(io.StringIO(self.data, newline='')),
+                         self.index)
+        self.assertEqual([d for d, _ in self.index['days']],
+                         [day('2016-06-01'), day('2016-06-03')])
+
+    def test_merge(self):
+        new_rows = [["2016-06-03T08:00:00", 15, "github.com"],
+                    ["2016-06-03T09:00:00", 5, "github.com"]]
+        out = io.StringIO(newline='')
+        index = write_merged_rescuetime(
+            out, io.StringIO(self.data, newline=''), self.index,
+            [(row_key(row, 2), row) for row in new_rows], 2)
+        # the existing row of 08:00 is replaced, not duplicated
+        self.assertEqual(json.loads(out.getvalue())['rows'],
+                         ROWS[:2] + new_rows)
+        self.assertEqual(build_index(io.StringIO(out.getvalue(),
+                                                 newline='')), index)
+
+    def test_trim_missing_day(self):
+        # there is no data for 2016-06-02, cut before the next day
+        index = trim_index(self.index, day('2016-06-02'))
+        self.assertEqual(index, trim_index(self.index, day('2016-06-03')))
+        index = trim_index(self.index, day('2016-06-10'))
+        self.assertEqual(index['rows_end'], self.index['rows_end'])
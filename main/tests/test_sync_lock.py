@@ -0,0 +1,71 @@
+from django.test import TestCase
+from redis.exceptions import LockError
+from datauploader.celery import INTERACTIVE_QUEUE, SCHEDULED_QUEUE
+from datauploader.helpers import (redis, claim_queued, acquire_sync_lock,
+                                  extend_sync_lock, release_sync_lock,
+                                  SYNC_LOCK_KEY, SYNC_QUEUED_KEY,
+                                  SYNC_LOCK_EXPIRY)
+
+OH_ID = 'test-sync-lock'
+
+
+class SyncLockTestCase(TestCase):
+    """
+    test the per member dedup of updates against the Redis server of the
+    tests
+    """
+
+    def setUp(self):
+        self.tearDown()
+
+    def tearDown(self):
+        redis.delete(SYNC_LOCK_KEY.format(OH_ID),
+                     SYNC_QUEUED_KEY.format(OH_ID))
+
+    def test_claim_queued(self):
+        self.assertTrue(claim_queued(OH_ID, queue=SCHEDULED_QUEUE))
+        self.assertFalse(claim_queued(OH_ID, queue=SCHEDULED_QUEUE))
+        # a member waiting for the dashboard gets an interactive update,
+        # but only one
+        self.assertTrue(claim_queued(OH_ID, queue=INTERACTIVE_QUEUE))
+        self.assertFalse(claim_queued(OH_ID, queue=INTERACTIVE_QUEUE))
+        self.assertFalse(claim_queued(OH_ID, queue=SCHEDULED_QUEUE))
+        self.assertLessEqual(redis.ttl(SYNC_QUEUED_KEY.format(OH_ID)), 3600)
+
+    def test_countdown(self):
+        self.assertTrue(claim_queued(OH_ID, countdown=600))
+        self.assertGreater(redis.ttl(SYNC_QUEUED_KEY.format(OH_ID)), 3600)
+
+    def test_acquire_sync_lock(self):
+        self.assertTrue(claim_queued(OH_ID))
+        lock = acquire_sync_lock(OH_ID)
+        self.assertIsNotNone(lock)
+        # running, no longer queued
+        self.assertFalse(redis.exists(SYNC_QUEUED_KEY.format(OH_ID)))
+        self.assertIsNone(acquire_sync_lock(OH_ID))
+        self.assertFalse(claim_queued(OH_ID))
+        self.assertFalse(claim_queued(OH_ID, queue=INTERACTIVE_QUEUE))
+        # the running update may queue its own retry, once
+        self.assertTrue(claim_queued(OH_ID, retry=True))
+        self.assertFalse(claim_queued(OH_ID, retry=True))
+        release_sync_lock(lock)
+        self.assertIsNotNone(acquire_sync_lock(OH_ID))
+
+    def test_extend_sync_lock(self):
+        lock = acquire_sync_lock(OH_ID)
+        key = SYNC_LOCK_KEY.format(OH_ID)
+        redis.expire(key, 10)
+        extend_sync_lock(lock)
+        self.assertGreater(redis.ttl(key), SYNC_LOCK_EXPIRY - 10)
+
+    def test_expired_lock(self):
+        lock = acquire_sync_lock(OH_ID)
+        redis.delete(SYNC_LOCK_KEY.format(OH_ID))
+        other = acquire_sync_lock(OH_ID)
+        self.assertIsNotNone(other)
+        with self.assertRaises(LockError):
+            extend_sync_lock(lock)
+        # releasing the expired lock leaves the other update's lock alone
+        release_sync_lock(lock)
+        self.assertIsNone(acquire_sync_lock(OH_ID))
+        release_sync_lock(other)
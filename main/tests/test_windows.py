@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+from django.test import TestCase
+from datauploader.windows import WindowPlanner
+
+
+class WindowPlannerTestCase(TestCase):
+    """
+    test that windows adapt to the observed row density
+    """
+
+    def setUp(self):
+        self.planner = WindowPlanner(datetime(2016, 1, 1),
+                                     datetime(2016, 12, 31),
+                                     target_rows=1000,
+                                     target_seconds=10)
+
+    def test_windows_cover_range(self):
+        windows = []
+        window = self.planner.next_window()
+        while window is not None:
+            windows.append(window)
+            window = self.planner.next_window()
+        self.assertEqual(windows[0][0], datetime(2016, 1, 1))
+        self.assertEqual(windows[-1][1], datetime(2016, 12, 31))
+        for previous, following in zip(windows, windows[1:]):
+            self.assertEqual(previous[1] + timedelta(days=1), following[0])
+
+    def test_empty_windows_grow(self):
+        window = self.planner.next_window()
+        self.planner.observe(window, 0, 1)
+        window = self.planner.next_window()
+        self.assertEqual((window[1] - window[0]).days + 1, 56)
+
+    def test_dense_windows_shrink(self):
+        window = self.planner.next_window()
+        self.planner.observe(window, 2000, 1)
+        window = self.planner.next_window()
+        self.assertEqual((window[1] - window[0]).days + 1, 7)
+
+    def test_slow_windows_shrink(self):
+        window = self.planner.next_window()
+        self.planner.observe(window, 10, 20)
+        window = self.planner.next_window()
+        self.assertEqual((window[1] - window[0]).days + 1, 7)
@@ -9,5 +9,6 @@ urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
     path('about/', views.about, name='about'),
     path('update_data/', views.update_data, name='update_data'),
-    path('remove_rescuetime/', views.remove_rescuetime, name='remove_rescuetime')
+    path('remove_rescuetime/', views.remove_rescuetime, name='remove_rescuetime'),
+    path('metrics/', views.metrics, name='metrics')
 ]
@@ -2,13 +2,20 @@ import logging
 import requests
 from django.contrib import messages
 from django.contrib.auth import login, logout
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import render, redirect
 from django.conf import settings
 from open_humans.models import OpenHumansMember
 from .models import DataSourceMember
-from .helpers import get_rescuetime_file, check_update
-from datauploader.tasks import process_rescuetime
+from .helpers import (get_rescuetime_file, get_rescuetime_data_files,
+                      check_update)
+from datauploader.celery import INTERACTIVE_QUEUE
+from datauploader.tasks import enqueue_rescuetime, update_queue
+from datauploader.helpers import clear_checkpoint
+from datauploader import cache
+from datauploader import metrics as update_metrics
 from ohapi import api
+from demotemplate.http_client import get_session
 import arrow
 
 # Set up logging.
@@ -78,7 +85,8 @@ def dashboard(request):
     if request.user.is_authenticated:
         if hasattr(request.user.oh_member, 'datasourcemember'):
             rescuetime_member = request.user.oh_member.datasourcemember
-            download_file = get_rescuetime_file(request.user.oh_member)
+            download_file, delta_files = get_rescuetime_file(
+                request.user.oh_member)
             if download_file == 'error':
                 logout(request)
                 return redirect("/")
@@ -88,6 +96,7 @@ def dashboard(request):
             allow_update = False
             rescuetime_member = ''
             download_file = ''
+            delta_files = []
             connect_url = ('https://www.rescuetime.com/oauth/authorize?'
                            'response_type=code&scope=time_data&'
                            'redirect_uri={}&client_id={}').format(
@@ -97,6 +106,7 @@ def dashboard(request):
             'oh_member': request.user.oh_member,
             'rescuetime_member': rescuetime_member,
             'download_file': download_file,
+            'delta_files': delta_files,
             'connect_url': connect_url,
             'allow_update': allow_update
         }
@@ -109,9 +119,14 @@ def remove_rescuetime(request):
     if request.method == "POST" and request.user.is_authenticated:
         try:
             oh_member = request.user.oh_member
-            api.delete_file(oh_member.access_token,
-                            oh_member.oh_id,
-                            file_basename="rescuetime.json")
+            # a new account must not resume from the rows of this one
+            clear_checkpoint(oh_member.oh_id)
+            cache.remove_member(oh_member.oh_id)
+            # base and delta files, in every format
+            for dfile in get_rescuetime_data_files(oh_member):
+                api.delete_file(oh_member.access_token,
+                                oh_member.oh_id,
+                                file_id=dfile['id'])
             messages.info(request, "Your Rescuetime account has been removed")
             rescuetime_account = request.user.oh_member.datasourcemember
             rescuetime_account.delete()
@@ -128,7 +143,12 @@ def remove_rescuetime(request):
 def update_data(request):
     if request.method == "POST" and request.user.is_authenticated:
         oh_member = request.user.oh_member
-        process_rescuetime.delay(oh_member.oh_id)
+        if not enqueue_rescuetime(oh_member.oh_id, queue=INTERACTIVE_QUEUE):
+            messages.info(request,
+                          ("An update of your Rescuetime data is already in "
+                           "progress. Reload this page in a while to find "
+                           "your data"))
+            return redirect('/dashboard')
         rescuetime_member = oh_member.datasourcemember
         rescuetime_member.last_submitted = arrow.now().format()
         rescuetime_member.save()
@@ -153,7 +173,11 @@ def rescuetime_complete(request):
 
     if rescuetime_member:
         messages.info(request, "Your Rescuetime account has been connected")
-        process_rescuetime.delay(ohmember.oh_id)
+        # the first import of the whole history runs in the background,
+        # reconnecting an account with data is a quick update
+        enqueue_rescuetime(ohmember.oh_id,
+                           queue=update_queue(rescuetime_member.last_uploaded,
+                                              INTERACTIVE_QUEUE))
         return redirect('/dashboard')
 
     logger.debug('Invalid code exchange. User returned to starting page.')
@@ -176,7 +200,7 @@ def rescuetime_code_to_member(code, ohmember):
             'client_id': settings.RESCUETIME_CLIENT_ID,
             'client_secret': settings.RESCUETIME_CLIENT_SECRET
         }
-        req = requests.post(
+        req = get_session().post(
             'https://www.rescuetime.com/oauth/token/',
             data=data
         )
@@ -225,7 +249,7 @@ def oh_code_to_member(code):
             '{}/complete'.format(settings.OPENHUMANS_APP_BASE_URL),
             'code': code,
         }
-        req = requests.post(
+        req = get_session().post(
             '{}/oauth2/token/'.format(settings.OPENHUMANS_OH_BASE_URL),
             data=data,
             auth=requests.auth.HTTPBasicAuth(
@@ -269,7 +293,7 @@ def oh_get_member_data(token):
     """
     Exchange OAuth2 token for member data.
     """
-    req = requests.get(
+    req = get_session().get(
         '{}/api/direct-sharing/project/exchange-member/'
         .format(settings.OPENHUMANS_OH_BASE_URL),
         params={'access_token': token}
@@ -278,3 +302,15 @@ def oh_get_member_data(token):
         return req.json()
     raise Exception('Status code {}'.format(req.status_code))
     return None
+
+
+def metrics(request):
+    """
+    Metrics of the updates in the Prometheus text format. If METRICS_TOKEN
+    is set it has to be sent as a bearer token.
+    """
+    if settings.METRICS_TOKEN and (request.META.get('HTTP_AUTHORIZATION') !=
+                                   'Bearer ' + settings.METRICS_TOKEN):
+        return HttpResponseForbidden()
+    return HttpResponse(update_metrics.render(),
+                        content_type='text/plain; version=0.0.4')
@@ -6,6 +6,8 @@ from django.contrib.auth.models import User
 from django.db import models
 import requests
 
+from demotemplate.http_client import get_session
+
 OH_BASE_URL = settings.OPENHUMANS_OH_BASE_URL
 OH_API_BASE = OH_BASE_URL + '/api/direct-sharing'
 OH_DELETE_FILES = OH_API_BASE + '/project/files/delete/'
@@ -85,7 +87,7 @@ class OpenHumansMember(models.Model):
         """
         Refresh access token.
         """
-        response = requests.post(
+        response = get_session().post(
             'https://www.openhumans.org/oauth2/token/',
             data={
                 'grant_type': 'refresh_token',
@@ -13,4 +13,5 @@ __author__ = "Nicholas Brochu"
 __version__ = "0.1.2"
 
 from .respectful_requester import RespectfulRequester
+from .async_respectful_requester import AsyncRespectfulRequester
 from .exceptions import *
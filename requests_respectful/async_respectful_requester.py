@@ -0,0 +1,184 @@
+from .globals import config
+from .exceptions import RequestsRespectfulError, RequestsRespectfulRateLimitedError
+from .respectful_requester import RespectfulRequester, MIN_WAIT, REQUEST_METHODS
+from .backends import AsyncRedisBackend
+
+from functools import partial
+
+import asyncio
+import inspect
+import time
+import uuid
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis < 4.2
+    aioredis = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class AsyncRespectfulRequester(RespectfulRequester):
+    # Asyncio counterpart of RespectfulRequester with the same realms and Redis keys, so both can share
+    # a realm. Waiting for capacity is awaited, as is the request when its function returns an awaitable.
+    # The proxied requests go through an async HTTP client (httpx by default).
+    # It always uses Redis, through an AsyncRedisBackend. Neither redis>=4.2 (for redis.asyncio) nor httpx is a
+    # dependency of the app, which only uses RespectfulRequester: install them to use this class.
+    # Request lambdas are validated like those of RespectfulRequester, so they may only call the module named by
+    # config["requests_module_name"] (e.g. "httpx", or the name the async client is bound to). send() needs no lambda.
+
+    def __init__(self, session=None, fair=False, redis=None):
+        if redis is None:
+            if aioredis is None:
+                raise RequestsRespectfulError("AsyncRespectfulRequester requires redis>=4.2 for 'redis.asyncio'")
+
+            redis = aioredis.StrictRedis(
+                host=config["redis"]["host"],
+                port=config["redis"]["port"],
+                password=config["redis"]["password"],
+                db=config["redis"]["database"]
+            )
+
+        self.backend = AsyncRedisBackend(redis, self.redis_prefix)
+        self.redis = redis
+        # Optional callable returning the async HTTP client (e.g. an httpx.AsyncClient) to send proxied requests through
+        self.session = session
+        self._default_session = None
+        # Requests that wait for capacity get it in the order they started waiting, across processes
+        self.fair = fair
+
+        # Realm configurations and the registered realms, cached for config["realm_cache_ttl"] seconds
+        self._realm_info_cache = dict()
+        self._registered_realms_cache = None
+
+    async def check_connection(self):
+        await self.backend.check_connection()
+
+    async def request(self, request_func, realms=None, wait=False):
+        self._validate_request_func(request_func)
+
+        return await self._request(request_func, realms=realms, wait=wait)
+
+    async def send(self, method, url, *args, realms=None, wait=False, **kwargs):
+        if method.lower() not in REQUEST_METHODS:
+            raise RequestsRespectfulError("'%s' is not a requests method" % method)
+
+        if not realms:
+            raise RequestsRespectfulError("'realms' is a required kwarg")
+
+        return await self._request(partial(getattr(self._session(), method.lower()), url, *args, **kwargs), realms=realms, wait=wait)
+
+    async def _request(self, request_func, realms=None, wait=False):
+        self._check_registered(realms, await self.fetch_registered_realms())
+
+        if wait:
+            request_id = str(uuid.uuid4())
+
+            while True:
+                try:
+                    return await self._perform_request(request_func, realms=realms, request_id=request_id, in_line=self.fair)
+                except RequestsRespectfulRateLimitedError as e:
+                    # Sleep exactly until the realms have capacity for this request
+                    await asyncio.sleep(max(e.wait, MIN_WAIT))
+        else:
+            return await self._perform_request(request_func, realms=realms)
+
+    async def fetch_registered_realms(self):
+        if self._registered_realms_cache is not None and self._registered_realms_cache[0] > time.time():
+            return self._registered_realms_cache[1]
+
+        return self._cache_registered_realms(await self.backend.registered_realms())
+
+    async def register_realm(self, realm, max_requests, timespan):
+        if await self.backend.register_realm(realm, max_requests, timespan):
+            self._invalidate_realm_cache(realm)
+
+        return True
+
+    async def register_realms(self, realm_tuples):
+        for realm_tuple in realm_tuples:
+            await self.register_realm(*realm_tuple)
+
+        return True
+
+    async def update_realm(self, realm, **kwargs):
+        updatable_keys = ["max_requests", "timespan"]
+
+        for updatable_key in updatable_keys:
+            if updatable_key in kwargs and type(kwargs[updatable_key]) == int:
+                await self.backend.update_realm(realm, updatable_key, kwargs[updatable_key])
+
+        self._invalidate_realm_cache(realm)
+
+        return True
+
+    async def unregister_realm(self, realm):
+        await self.backend.unregister_realm(realm)
+        self._invalidate_realm_cache(realm)
+
+        return True
+
+    async def unregister_realms(self, realms):
+        for realm in realms:
+            await self.unregister_realm(realm)
+
+        return True
+
+    async def realm_max_requests(self, realm):
+        return (await self.realm_limits(realm))[0]
+
+    async def realm_timespan(self, realm):
+        return (await self.realm_limits(realm))[1]
+
+    async def realm_limits(self, realm):
+        cached = self._realm_info_cache.get(realm)
+
+        if cached is not None and cached[0] > time.time():
+            return cached[1]
+
+        return self._cache_realm_limits(realm, await self.backend.realm_limits(realm))
+
+    async def _perform_request(self, request_func, realms=None, request_id=None, in_line=False):
+        wait, rate_limited_realms = await self._reserve(realms, request_id or str(uuid.uuid4()), in_line)
+
+        if not len(rate_limited_realms):
+            response = request_func()
+
+            if inspect.isawaitable(response):
+                response = await response
+
+            return response
+        else:
+            raise self._rate_limited_error(rate_limited_realms, wait)
+
+    async def _reserve(self, realms, request_id, in_line=False):
+        realm_limits = [self._reserve_limits(await self.realm_limits(realm)) for realm in realms]
+        wait, rate_limited = await self.backend.reserve(realms, realm_limits, request_id, in_line)
+
+        return wait, [realms[i] for i in rate_limited]
+
+    # Requests proxy
+    async def _requests_proxy(self, method, *args, **kwargs):
+        realms = kwargs.pop("realms", list())
+
+        if not len(realms):
+            raise RequestsRespectfulError("'realms' is a required kwarg")
+
+        wait = kwargs.pop("wait", False)
+
+        return await self.send(method, *args, realms=realms, wait=wait, **kwargs)
+
+    def _session(self):
+        if self.session is not None:
+            return self.session()
+
+        if httpx is None:
+            raise RequestsRespectfulError("AsyncRespectfulRequester requires httpx or a 'session' returning an async HTTP client")
+
+        if self._default_session is None:
+            self._default_session = httpx.AsyncClient()
+
+        return self._default_session
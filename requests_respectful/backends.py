@@ -0,0 +1,306 @@
+from .exceptions import RequestsRespectfulRedisError
+
+from redis import ConnectionError
+
+from collections import OrderedDict, deque
+
+import threading
+import time
+
+
+# Checks all realms of a request and reserves it in all of them, or in none.
+# KEYS: for each realm the sorted set of its requests scored by their time, the sorted set of its
+#   waiting requests scored by their arrival and the sorted set of when those were last seen waiting
+# ARGV: now, request id, whether the request waits in line, then the max requests and timespan of each realm
+# Returns the seconds to wait until the request can be made (0 if it was reserved), followed by the
+# positions of the realms that are rate-limited.
+#
+# Requests that wait in line only get capacity that isn't needed by the requests waiting before them,
+# and are told to wait until enough requests left the timespan for their position in line. Requests that
+# don't wait in line are only made if there is capacity for everyone waiting. Waiters that weren't seen
+# for two timespans have given up and leave the line.
+RESERVE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local request_id = ARGV[2]
+local in_line = ARGV[3] == "1"
+local wait = 0
+local limited = {}
+
+for i = 1, #KEYS / 3 do
+    local requests_key, waiting_key, seen_key = KEYS[3 * i - 2], KEYS[3 * i - 1], KEYS[3 * i]
+    local max_requests = tonumber(ARGV[2 + 2 * i])
+    local timespan = tonumber(ARGV[3 + 2 * i])
+
+    redis.call("ZREMRANGEBYSCORE", requests_key, "-inf", now - timespan)
+    local requests = redis.call("ZCARD", requests_key)
+
+    local gone = redis.call("ZRANGEBYSCORE", seen_key, "-inf", now - 2 * timespan)
+    for _, waiter in ipairs(gone) do
+        redis.call("ZREM", waiting_key, waiter)
+        redis.call("ZREM", seen_key, waiter)
+    end
+
+    local ahead
+    if in_line then
+        redis.call("ZADD", waiting_key, "NX", now, request_id)
+        redis.call("ZADD", seen_key, now, request_id)
+        redis.call("EXPIRE", waiting_key, math.ceil(2 * timespan))
+        redis.call("EXPIRE", seen_key, math.ceil(2 * timespan))
+        ahead = redis.call("ZRANK", waiting_key, request_id)
+    else
+        ahead = redis.call("ZCARD", waiting_key)
+    end
+
+    if requests + ahead >= max_requests then
+        local realm_wait = timespan
+        local oldest_needed = requests + ahead - max_requests
+        if max_requests > 0 and oldest_needed < requests then
+            -- the request can be made once enough of the oldest requests left the timespan
+            local oldest = redis.call("ZRANGE", requests_key, oldest_needed, oldest_needed, "WITHSCORES")
+            realm_wait = tonumber(oldest[2]) + timespan - now
+        end
+        wait = math.max(wait, realm_wait)
+        table.insert(limited, i)
+    end
+end
+
+if #limited == 0 then
+    for i = 1, #KEYS / 3 do
+        redis.call("ZADD", KEYS[3 * i - 2], now, request_id)
+        redis.call("EXPIRE", KEYS[3 * i - 2], math.ceil(tonumber(ARGV[3 + 2 * i])))
+        redis.call("ZREM", KEYS[3 * i - 1], request_id)
+        redis.call("ZREM", KEYS[3 * i], request_id)
+    end
+end
+
+-- floats would be truncated to integers in the reply
+local reply = {tostring(wait)}
+for _, i in ipairs(limited) do
+    table.insert(reply, i)
+end
+return reply
+"""
+
+
+class RedisBackend:
+    # Keeps realms and their requests in Redis, shared by all processes using the same Redis database
+
+    def __init__(self, redis, prefix):
+        self.redis = redis
+        self.prefix = prefix
+
+        self._reserve_script = self.redis.register_script(RESERVE_SCRIPT)
+
+    def check_connection(self):
+        try:
+            self.redis.echo("Testing Connection")
+        except ConnectionError:
+            raise RequestsRespectfulRedisError("Could not establish a connection to the provided Redis server")
+
+    def registered_realms(self):
+        return list(map(lambda k: k.decode("utf-8"), self.redis.smembers(self._realms_key())))
+
+    def realm_limits(self, realm):
+        return self._parse_realm_info(self.redis.hgetall(self._realm_key(realm)))
+
+    def register_realm(self, realm, max_requests, timespan):
+        # Returns whether the realm was registered, realms that exist already are left as they are
+        redis_key = self._realm_key(realm)
+
+        if self.redis.hexists(redis_key, "max_requests"):
+            return False
+
+        self.redis.hmset(redis_key, {"max_requests": max_requests, "timespan": timespan})
+        self.redis.sadd(self._realms_key(), realm)
+
+        return True
+
+    def update_realm(self, realm, key, value):
+        self.redis.hset(self._realm_key(realm), key, value)
+
+    def unregister_realm(self, realm):
+        self.redis.delete(self._realm_key(realm), *self._realm_request_keys(realm))
+        self.redis.srem(self._realms_key(), realm)
+
+    def reserve(self, realms, realm_limits, request_id, in_line, now=None):
+        # Atomically checks and reserves a request in all realms in a single round trip.
+        # Returns the seconds until all realms have capacity and the positions of the realms that are rate-limited.
+        keys, args = self._reserve_input(realms, realm_limits, request_id, in_line, now)
+
+        return self._parse_reserve_reply(self._reserve_script(keys=keys, args=args))
+
+    def _realms_key(self):
+        return "%s:REALMS" % self.prefix
+
+    def _realm_key(self, realm):
+        return "%s:REALMS:%s" % (self.prefix, realm)
+
+    def _realm_request_keys(self, realm):
+        # The realm's requests, its waiting requests and when those were last seen, see RESERVE_SCRIPT
+        return [
+            "%s:REQUESTS:%s" % (self.prefix, realm),
+            "%s:WAITING:%s" % (self.prefix, realm),
+            "%s:WAITING_SEEN:%s" % (self.prefix, realm)
+        ]
+
+    def _reserve_input(self, realms, realm_limits, request_id, in_line, now):
+        keys = list()
+        args = [now if now is not None else time.time(), request_id, 1 if in_line else 0]
+
+        for realm, (max_requests, timespan) in zip(realms, realm_limits):
+            keys.extend(self._realm_request_keys(realm))
+            args.extend([max_requests, timespan])
+
+        return keys, args
+
+    @staticmethod
+    def _parse_reserve_reply(reply):
+        return float(reply[0]), [i - 1 for i in reply[1:]]
+
+    @staticmethod
+    def _parse_realm_info(realm_info):
+        if not realm_info:
+            return None
+
+        return (
+            int(realm_info["max_requests".encode("utf-8")].decode("utf-8")),
+            int(realm_info["timespan".encode("utf-8")].decode("utf-8"))
+        )
+
+
+class AsyncRedisBackend(RedisBackend):
+    # RedisBackend for an asyncio Redis client (redis.asyncio), with the same keys
+
+    async def check_connection(self):
+        try:
+            await self.redis.echo("Testing Connection")
+        except Exception:
+            raise RequestsRespectfulRedisError("Could not establish a connection to the provided Redis server")
+
+    async def registered_realms(self):
+        return list(map(lambda k: k.decode("utf-8"), await self.redis.smembers(self._realms_key())))
+
+    async def realm_limits(self, realm):
+        return self._parse_realm_info(await self.redis.hgetall(self._realm_key(realm)))
+
+    async def register_realm(self, realm, max_requests, timespan):
+        redis_key = self._realm_key(realm)
+
+        if await self.redis.hexists(redis_key, "max_requests"):
+            return False
+
+        await self.redis.hset(redis_key, mapping={"max_requests": max_requests, "timespan": timespan})
+        await self.redis.sadd(self._realms_key(), realm)
+
+        return True
+
+    async def update_realm(self, realm, key, value):
+        await self.redis.hset(self._realm_key(realm), key, value)
+
+    async def unregister_realm(self, realm):
+        await self.redis.delete(self._realm_key(realm), *self._realm_request_keys(realm))
+        await self.redis.srem(self._realms_key(), realm)
+
+    async def reserve(self, realms, realm_limits, request_id, in_line, now=None):
+        keys, args = self._reserve_input(realms, realm_limits, request_id, in_line, now)
+
+        return self._parse_reserve_reply(await self._reserve_script(keys=keys, args=args))
+
+
+class MemoryBackend:
+    # Keeps realms and their requests in the memory of the process, for a single process and its threads.
+    # Works exactly like RESERVE_SCRIPT, with a lock instead of Redis making the reservations atomic.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # realm -> (max_requests, timespan)
+        self._realms = dict()
+        # realm -> times of the requests in the timespan, oldest first
+        self._requests = dict()
+        # realm -> ids of the waiting requests in the order they started waiting, with when they were last seen
+        self._waiting = dict()
+
+    def check_connection(self):
+        pass
+
+    def registered_realms(self):
+        with self._lock:
+            return list(self._realms)
+
+    def realm_limits(self, realm):
+        with self._lock:
+            return self._realms.get(realm)
+
+    def register_realm(self, realm, max_requests, timespan):
+        with self._lock:
+            if realm in self._realms:
+                return False
+
+            self._realms[realm] = (max_requests, timespan)
+            self._requests[realm] = deque()
+            self._waiting[realm] = OrderedDict()
+
+            return True
+
+    def update_realm(self, realm, key, value):
+        with self._lock:
+            max_requests, timespan = self._realms[realm]
+
+            if key == "max_requests":
+                self._realms[realm] = (value, timespan)
+            else:
+                self._realms[realm] = (max_requests, value)
+
+    def unregister_realm(self, realm):
+        with self._lock:
+            self._realms.pop(realm, None)
+            self._requests.pop(realm, None)
+            self._waiting.pop(realm, None)
+
+    def reserve(self, realms, realm_limits, request_id, in_line, now=None):
+        with self._lock:
+            # Read the time while holding the lock, so the times of the requests are appended in order
+            if now is None:
+                now = time.time()
+
+            wait = 0
+            limited = list()
+
+            for i, (realm, (max_requests, timespan)) in enumerate(zip(realms, realm_limits)):
+                requests = self._requests.setdefault(realm, deque())
+                waiting = self._waiting.setdefault(realm, OrderedDict())
+
+                while requests and requests[0] <= now - timespan:
+                    requests.popleft()
+
+                for waiter, seen in list(waiting.items()):
+                    if seen <= now - 2 * timespan:
+                        del waiting[waiter]
+
+                if in_line:
+                    waiting[request_id] = now
+                    ahead = list(waiting).index(request_id)
+                else:
+                    ahead = len(waiting)
+
+                if len(requests) + ahead >= max_requests:
+                    realm_wait = timespan
+                    oldest_needed = len(requests) + ahead - max_requests
+
+                    if max_requests > 0 and oldest_needed < len(requests):
+                        # the request can be made once enough of the oldest requests left the timespan
+                        realm_wait = requests[oldest_needed] + timespan - now
+
+                    wait = max(wait, realm_wait)
+                    limited.append(i)
+
+            if not len(limited):
+                for realm in realms:
+                    self._requests[realm].append(now)
+                    self._waiting[realm].pop(request_id, None)
+
+            return wait, limited
+
+
+# The MemoryBackend shared by all requesters of the process
+memory_backend = MemoryBackend()
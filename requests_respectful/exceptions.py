@@ -4,7 +4,10 @@ class RequestsRespectfulError(Exception):
 
 
 class RequestsRespectfulRateLimitedError(Exception):
-    pass
+    def __init__(self, message=None, wait=None):
+        Exception.__init__(self, message)
+        # Seconds until the realms have capacity again
+        self.wait = wait
 
 
 class RequestsRespectfulConfigError(Exception):
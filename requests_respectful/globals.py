@@ -1,7 +1,9 @@
 import yaml
 import copy
 
-from redis import StrictRedis, ConnectionError
+from functools import lru_cache
+
+from redis import StrictRedis
 
 from .exceptions import RequestsRespectfulConfigError
 
@@ -20,7 +22,9 @@ default_config = {
         "database": 0
     },
     "safety_threshold": 10,
-    "requests_module_name": "requests"
+    "requests_module_name": "requests",
+    "realm_cache_ttl": 10,
+    "backend": "redis"
 }
 
 try:
@@ -43,8 +47,27 @@ try:
                 "'requests_module_name' key must be a string in 'requests-respectful.config.yml'"
             )
 
+    if "realm_cache_ttl" not in config:
+        config["realm_cache_ttl"] = default_config.get("realm_cache_ttl")
+    else:
+        if type(config["realm_cache_ttl"]) not in (int, float) or config["realm_cache_ttl"] < 0:
+            raise RequestsRespectfulConfigError(
+                "'realm_cache_ttl' key must be a positive number in 'requests-respectful.config.yml'"
+            )
+
+    if "backend" not in config:
+        config["backend"] = default_config.get("backend")
+    else:
+        if config["backend"] not in ["redis", "memory"]:
+            raise RequestsRespectfulConfigError(
+                "'backend' key must be one of redis, memory in 'requests-respectful.config.yml'"
+            )
+
     if "redis" not in config:
-        raise RequestsRespectfulConfigError("'redis' key is missing from 'requests-respectful.config.yml'")
+        if config["backend"] == "redis":
+            raise RequestsRespectfulConfigError("'redis' key is missing from 'requests-respectful.config.yml'")
+
+        config["redis"] = copy.deepcopy(default_config.get("redis"))
 
     expected_redis_keys = ["host", "port", "password", "database"]
     missing_redis_keys = list()
@@ -65,9 +88,17 @@ except FileNotFoundError:
 
 
 # REDIS CLIENT
-redis = StrictRedis(
-    host=config["redis"]["host"],
-    port=config["redis"]["port"],
-    password=config["redis"]["password"],
-    db=config["redis"]["database"]
-)
+def redis_from_config():
+    return StrictRedis(
+        host=config["redis"]["host"],
+        port=config["redis"]["port"],
+        password=config["redis"]["password"],
+        db=config["redis"]["database"]
+    )
+
+
+# The client shared by all requesters of the Redis backend, only created once one of them needs it.
+# RespectfulRequester.configure() clears it when the Redis configuration changes.
+@lru_cache(maxsize=None)
+def shared_redis():
+    return redis_from_config()
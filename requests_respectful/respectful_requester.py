@@ -1,29 +1,48 @@
-from .globals import default_config, config, redis
-from .exceptions import RequestsRespectfulError, RequestsRespectfulConfigError, RequestsRespectfulRateLimitedError, RequestsRespectfulRedisError
-
-from redis import StrictRedis, ConnectionError
+from .globals import default_config, config, shared_redis
+from .exceptions import RequestsRespectfulError, RequestsRespectfulConfigError, RequestsRespectfulRateLimitedError
+from .backends import RedisBackend, memory_backend
 
 import uuid
 import inspect
 import time
 
+from functools import partial
+
 import requests
 
 import warnings
 
 
+BACKENDS = ["redis", "memory"]
+
+# Shortest sleep between two attempts of a waiting request, in seconds
+MIN_WAIT = 0.01
+
+REQUEST_METHODS = ["delete", "get", "head", "options", "patch", "post", "put"]
+
+# Code objects of request lambdas that passed validation, with the requests module name they were validated for
+validated_request_code = set()
+
+
 class RespectfulRequester:
 
-    def __init__(self):
-        self.redis = redis
+    def __init__(self, session=None, fair=False, backend=None):
+        # Where realms and their requests are kept, by default the backend selected by config["backend"]
+        self.backend = backend if backend is not None else self._default_backend()
+        self.redis = getattr(self.backend, "redis", None)
+        # Optional callable returning the requests.Session to send proxied requests through
+        self.session = session
+        # Requests that wait for capacity get it in the order they started waiting, across processes
+        self.fair = fair
 
-        try:
-            self.redis.echo("Testing Connection")
-        except ConnectionError:
-            raise RequestsRespectfulRedisError("Could not establish a connection to the provided Redis server")
+        # Realm configurations and the registered realms, cached for config["realm_cache_ttl"] seconds
+        self._realm_info_cache = dict()
+        self._registered_realms_cache = None
+
+        self.backend.check_connection()
 
     def __getattr__(self, attr):
-        if attr in ["delete", "get", "head", "options", "patch", "post", "put"]:
+        if attr in REQUEST_METHODS:
             return getattr(self, "_requests_proxy_%s" % attr)
         else:
             raise AttributeError()
@@ -37,32 +56,45 @@ class RespectfulRequester:
             warnings.warn("'realm' kwarg will be removed in favor of providing a 'realms' list starting in 0.3.0", DeprecationWarning)
             realms = [realm]
 
-        registered_realms = self.fetch_registered_realms()
+        self._validate_request_func(request_func)
 
-        for r in realms:
-            if r not in registered_realms:
-                raise RequestsRespectfulError("Realm '%s' hasn't been registered" % realm)
+        return self._request(request_func, realms=realms, wait=wait)
+
+    def send(self, method, url, *args, realms=None, wait=False, **kwargs):
+        # Structured alternative to request(): builds the requests call from its method, url and arguments
+        # itself, so there is no lambda to validate
+        if method.lower() not in REQUEST_METHODS:
+            raise RequestsRespectfulError("'%s' is not a requests method" % method)
+
+        if not realms:
+            raise RequestsRespectfulError("'realms' is a required kwarg")
+
+        return self._request(partial(getattr(self._session(), method.lower()), url, *args, **kwargs), realms=realms, wait=wait)
+
+    def _request(self, request_func, realms=None, wait=False):
+        self._check_registered(realms, self.fetch_registered_realms())
 
         if wait:
+            request_id = str(uuid.uuid4())
+
             while True:
                 try:
-                    return self._perform_request(request_func, realms=realms)
-                except RequestsRespectfulRateLimitedError:
-                    pass
-
-                time.sleep(1)
+                    return self._perform_request(request_func, realms=realms, request_id=request_id, in_line=self.fair)
+                except RequestsRespectfulRateLimitedError as e:
+                    # Sleep exactly until the realms have capacity for this request
+                    time.sleep(max(e.wait, MIN_WAIT))
         else:
             return self._perform_request(request_func, realms=realms)
 
     def fetch_registered_realms(self):
-        return list(map(lambda k: k.decode("utf-8"), self.redis.smembers("%s:REALMS" % self.redis_prefix)))
+        if self._registered_realms_cache is not None and self._registered_realms_cache[0] > time.time():
+            return self._registered_realms_cache[1]
 
-    def register_realm(self, realm, max_requests, timespan):
-        redis_key = self._realm_redis_key(realm)
+        return self._cache_registered_realms(self.backend.registered_realms())
 
-        if not self.redis.hexists(redis_key, "max_requests"):
-            self.redis.hmset(redis_key, {"max_requests": max_requests, "timespan": timespan})
-            self.redis.sadd("%s:REALMS" % self.redis_prefix, realm)
+    def register_realm(self, realm, max_requests, timespan):
+        if self.backend.register_realm(realm, max_requests, timespan):
+            self._invalidate_realm_cache(realm)
 
         return True
 
@@ -73,21 +105,19 @@ class RespectfulRequester:
         return True
 
     def update_realm(self, realm, **kwargs):
-        redis_key = self._realm_redis_key(realm)
         updatable_keys = ["max_requests", "timespan"]
 
         for updatable_key in updatable_keys:
             if updatable_key in kwargs and type(kwargs[updatable_key]) == int:
-                self.redis.hset(redis_key, updatable_key, kwargs[updatable_key])
+                self.backend.update_realm(realm, updatable_key, kwargs[updatable_key])
+
+        self._invalidate_realm_cache(realm)
 
         return True
 
     def unregister_realm(self, realm):
-        self.redis.delete(self._realm_redis_key(realm))
-        self.redis.srem("%s:REALMS" % self.redis_prefix, realm)
-
-        request_keys = self.redis.keys("%s:REQUEST:%s:*" % (self.redis_prefix, realm))
-        [self.redis.delete(k) for k in request_keys]
+        self.backend.unregister_realm(realm)
+        self._invalidate_realm_cache(realm)
 
         return True
 
@@ -98,12 +128,18 @@ class RespectfulRequester:
         return True
 
     def realm_max_requests(self, realm):
-        realm_info = self._fetch_realm_info(realm)
-        return int(realm_info["max_requests".encode("utf-8")].decode("utf-8"))
+        return self.realm_limits(realm)[0]
 
     def realm_timespan(self, realm):
-        realm_info = self._fetch_realm_info(realm)
-        return int(realm_info["timespan".encode("utf-8")].decode("utf-8"))
+        return self.realm_limits(realm)[1]
+
+    def realm_limits(self, realm):
+        cached = self._realm_info_cache.get(realm)
+
+        if cached is not None and cached[0] > time.time():
+            return cached[1]
+
+        return self._cache_realm_limits(realm, self.backend.realm_limits(realm))
 
     @classmethod
     def configure(cls, **kwargs):
@@ -125,14 +161,7 @@ class RespectfulRequester:
                 ))
 
             config["redis"] = kwargs["redis"]
-
-            global redis
-            redis = StrictRedis(
-                host=config["redis"]["host"],
-                port=config["redis"]["port"],
-                password=config["redis"]["password"],
-                db=config["redis"]["database"]
-            )
+            shared_redis.cache_clear()
 
         if "safety_threshold" in kwargs:
             if type(kwargs["safety_threshold"]) != int or kwargs["safety_threshold"] < 0:
@@ -146,6 +175,18 @@ class RespectfulRequester:
 
             config["requests_module_name"] = kwargs["requests_module_name"]
 
+        if "realm_cache_ttl" in kwargs:
+            if type(kwargs["realm_cache_ttl"]) not in (int, float) or kwargs["realm_cache_ttl"] < 0:
+                raise RequestsRespectfulConfigError("'realm_cache_ttl' key must be a positive number")
+
+            config["realm_cache_ttl"] = kwargs["realm_cache_ttl"]
+
+        if "backend" in kwargs:
+            if kwargs["backend"] not in BACKENDS:
+                raise RequestsRespectfulConfigError("'backend' key must be one of %s" % ", ".join(BACKENDS))
+
+            config["backend"] = kwargs["backend"]
+
         return config
 
     @classmethod
@@ -155,50 +196,64 @@ class RespectfulRequester:
 
         return config
 
-    def _perform_request(self, request_func, realms=None):
-        self._validate_request_func(request_func)
+    def _perform_request(self, request_func, realms=None, request_id=None, in_line=False):
+        wait, rate_limited_realms = self._reserve(realms, request_id or str(uuid.uuid4()), in_line)
 
-        rate_limited_realms = list()
+        if not len(rate_limited_realms):
+            return request_func()
+        else:
+            raise self._rate_limited_error(rate_limited_realms, wait)
 
-        for realm in realms:
-            if not self._can_perform_request(realm):
-                rate_limited_realms.append(realm)
+    def _default_backend(self):
+        if config["backend"] == "memory":
+            return memory_backend
 
-        if not len(rate_limited_realms):
-            for realm in realms:
-                request_uuid = str(uuid.uuid4())
+        return RedisBackend(shared_redis(), self.redis_prefix)
 
-                self.redis.setex(
-                    name="%s:REQUEST:%s:%s" % (self.redis_prefix, realm, request_uuid),
-                    time=self.realm_timespan(realm),
-                    value=request_uuid
-                )
+    def _cache_realm_limits(self, realm, realm_limits):
+        if realm_limits is None:
+            raise RequestsRespectfulError("Realm '%s' hasn't been registered" % realm)
 
-            return request_func()
-        else:
-            raise RequestsRespectfulRateLimitedError("Currently rate-limited on Realm(s): %s" % ", ".join(rate_limited_realms))
-
-    def _realm_redis_key(self, realm):
-        return "%s:REALMS:%s" % (self.redis_prefix, realm)
-
-    def _fetch_realm_info(self, realm):
-        redis_key = self._realm_redis_key(realm)
-        return self.redis.hgetall(redis_key)
-
-    def _requests_in_timespan(self, realm):
-        return len(
-            self.redis.scan(
-                cursor=0,
-                match="%s:REQUEST:%s:*" % (self.redis_prefix, realm),
-                count=self._redis_keys_in_db() + 100
-            )[1]
+        self._realm_info_cache[realm] = (time.time() + config["realm_cache_ttl"], realm_limits)
+
+        return realm_limits
+
+    def _cache_registered_realms(self, registered_realms):
+        self._registered_realms_cache = (time.time() + config["realm_cache_ttl"], registered_realms)
+
+        return registered_realms
+
+    def _invalidate_realm_cache(self, realm):
+        # Other processes only see the change once their cache expired
+        self._realm_info_cache.pop(realm, None)
+        self._registered_realms_cache = None
+
+    def _reserve(self, realms, request_id, in_line=False):
+        # Atomically checks and reserves a request in all realms.
+        # Returns the seconds until all realms have capacity and the realms that are rate-limited.
+        wait, rate_limited = self.backend.reserve(
+            realms, [self._reserve_limits(self.realm_limits(realm)) for realm in realms], request_id, in_line
         )
 
-    def _redis_keys_in_db(self):
-        return self.redis.info().get("db%d" % config["redis"]["database"]).get("keys")
+        return wait, [realms[i] for i in rate_limited]
 
-    def _can_perform_request(self, realm):
-        return self._requests_in_timespan(realm) < (self.realm_max_requests(realm) - config["safety_threshold"])
+    @staticmethod
+    def _reserve_limits(realm_limits):
+        max_requests, timespan = realm_limits
+        return max_requests - config["safety_threshold"], timespan
+
+    @staticmethod
+    def _check_registered(realms, registered_realms):
+        for realm in realms:
+            if realm not in registered_realms:
+                raise RequestsRespectfulError("Realm '%s' hasn't been registered" % realm)
+
+    @staticmethod
+    def _rate_limited_error(rate_limited_realms, wait):
+        return RequestsRespectfulRateLimitedError(
+            "Currently rate-limited on Realm(s): %s" % ", ".join(rate_limited_realms),
+            wait=wait
+        )
 
     # Requests proxy
     def _requests_proxy(self, method, *args, **kwargs):
@@ -214,7 +269,10 @@ class RespectfulRequester:
 
         wait = kwargs.pop("wait", False)
 
-        return self.request(lambda: getattr(requests, method)(*args, **kwargs), realms=realms, wait=wait)
+        return self.send(method, *args, realms=realms, wait=wait, **kwargs)
+
+    def _session(self):
+        return self.session() if self.session is not None else requests
 
     def _requests_proxy_delete(self, *args, **kwargs):
         return self._requests_proxy("delete", *args, **kwargs)
@@ -239,12 +297,26 @@ class RespectfulRequester:
 
     @staticmethod
     def _validate_request_func(request_func):
-        request_func_string = inspect.getsource(request_func)
-        post_lambda_string = request_func_string.split(":")[1].strip()
+        # A lambda is only validated the first time its code is seen
+        code = getattr(request_func, "__code__", None)
+        validation_key = (code, config["requests_module_name"])
 
-        if not post_lambda_string.startswith(config["requests_module_name"]) and not post_lambda_string.startswith("getattr(requests"):
+        if code is not None and validation_key in validated_request_code:
+            return
+
+        try:
+            request_func_string = inspect.getsource(request_func)
+            post_lambda_string = request_func_string.split(":")[1].strip()
+            valid = post_lambda_string.startswith(config["requests_module_name"]) or post_lambda_string.startswith("getattr(requests")
+        except (OSError, TypeError, IndexError):
+            # No source (REPL, compiled-only deployments): the first name the lambda looks up has to be the requests module
+            valid = code is not None and code.co_names[:1] == (config["requests_module_name"],)
+
+        if not valid:
             raise RequestsRespectfulError("The request lambda can only contain a requests function call")
 
+        validated_request_code.add(validation_key)
+
     @staticmethod
     def _config():
         return config